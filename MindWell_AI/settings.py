@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -88,11 +89,39 @@ TEMPLATES = [
 ASGI_APPLICATION = "MindWell_AI.asgi.application"
 
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# Set CHANNEL_BROKER_SOCKET to run several ASGI workers on one host; they
+# then share groups through `manage.py run_channel_broker`.
+CHANNEL_BROKER_SOCKET = config('CHANNEL_BROKER_SOCKET', default='')
+
+if CHANNEL_BROKER_SOCKET:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'group.channel_layer.UnixSocketChannelLayer',
+            'CONFIG': {
+                'path': CHANNEL_BROKER_SOCKET,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Several workers also need one cache between them, or an invalidation in
+# one (users/sidebar.py) leaves the others serving stale entries. A single
+# process keeps the default in-memory cache.
+if CHANNEL_BROKER_SOCKET:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default='/tmp/healchat-cache'),
+            'OPTIONS': {
+                'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+            },
+        },
+    }
 
 # CHANNEL_LAYERS = {
 #     "default": {
@@ -177,4 +206,82 @@ REST_FRAMEWORK = {
 API_KEY = config("CHAT_API_KEY")
 API_URL = config("API_Url")
 
+# Streaming endpoint used by /api/chatbot/api/chat/stream/. Defaults to the SSE
+# flavour of the configured generateContent URL.
+_stream_url = API_URL.replace(":generateContent", ":streamGenerateContent")
+API_STREAM_URL = config(
+    "API_Stream_Url",
+    default=_stream_url + ("&" if "?" in _stream_url else "?") + "alt=sse",
+)
+
+# Upstream LLM client: connection reuse, timeouts (seconds) and how many calls
+# one process may have in flight before new turns wait / fail fast.
+LLM_CONNECT_TIMEOUT = config("LLM_CONNECT_TIMEOUT", default=5.0, cast=float)
+LLM_READ_TIMEOUT = config("LLM_READ_TIMEOUT", default=30.0, cast=float)
+LLM_MAX_INFLIGHT = config("LLM_MAX_INFLIGHT", default=256, cast=int)
+LLM_MAX_KEEPALIVE = config("LLM_MAX_KEEPALIVE", default=32, cast=int)
+LLM_QUEUE_TIMEOUT = config("LLM_QUEUE_TIMEOUT", default=10.0, cast=float)
+
+# Retries (429/5xx/transport errors), circuit breaker and reply cache.
+LLM_MAX_RETRIES = config("LLM_MAX_RETRIES", default=2, cast=int)
+LLM_BACKOFF_BASE = config("LLM_BACKOFF_BASE", default=0.5, cast=float)
+LLM_BACKOFF_MAX = config("LLM_BACKOFF_MAX", default=4.0, cast=float)
+LLM_BREAKER_THRESHOLD = config("LLM_BREAKER_THRESHOLD", default=5, cast=int)
+LLM_BREAKER_RESET = config("LLM_BREAKER_RESET", default=30.0, cast=float)
+LLM_CACHE_SIZE = config("LLM_CACHE_SIZE", default=1024, cast=int)
+LLM_CACHE_TTL = config("LLM_CACHE_TTL", default=300.0, cast=float)
+
+# Chatbot context: token budget for recent turns, and how older turns are
+# folded into the per-user rolling summary.
+CHAT_CONTEXT_TOKENS = config("CHAT_CONTEXT_TOKENS", default=2000, cast=int)
+CHAT_CONTEXT_MAX_TURNS = config("CHAT_CONTEXT_MAX_TURNS", default=40, cast=int)
+CHAT_SUMMARY_BATCH = config("CHAT_SUMMARY_BATCH", default=6, cast=int)
+CHAT_SUMMARY_TOKENS = config("CHAT_SUMMARY_TOKENS", default=300, cast=int)
+
+# Group chat write-behind (see group/write_behind.py): broadcast first,
+# persist in batches. SQLite and a single ASGI worker only.
+GROUP_WRITE_BEHIND = config('GROUP_WRITE_BEHIND', default=False, cast=bool)
+if GROUP_WRITE_BEHIND and CHANNEL_BROKER_SOCKET:
+    # Each worker would reserve its own id blocks, so ids would stop
+    # following the order messages were sent.
+    raise ImproperlyConfigured("GROUP_WRITE_BEHIND cannot be used with CHANNEL_BROKER_SOCKET (several workers)")
+GROUP_WRITE_BEHIND_INTERVAL_MS = config('GROUP_WRITE_BEHIND_INTERVAL_MS', default=50, cast=int)
+GROUP_WRITE_BEHIND_BATCH = config('GROUP_WRITE_BEHIND_BATCH', default=200, cast=int)
+GROUP_WRITE_BEHIND_RETRIES = config('GROUP_WRITE_BEHIND_RETRIES', default=5, cast=int)
+GROUP_WRITE_BEHIND_ID_BLOCK = config('GROUP_WRITE_BEHIND_ID_BLOCK', default=100, cast=int)
+
+# users/presence.py: a user counts as online this long after their last
+# activity; last_seen is written back in batches this often.
+PRESENCE_TIMEOUT = config('PRESENCE_TIMEOUT', default=60, cast=int)
+PRESENCE_FLUSH_INTERVAL = config('PRESENCE_FLUSH_INTERVAL', default=30, cast=int)
+
+# Seconds a user's cached sidebar (groups, recent chats) is kept; it is also
+# dropped whenever it changes. See users/sidebar.py.
+SIDEBAR_CACHE_TIMEOUT = config('SIDEBAR_CACHE_TIMEOUT', default=60, cast=int)
+
+# Sidebar search autocomplete (group/autocomplete.py): how long a prefix's
+# results are cached, and how often each process reloads its in-memory index
+# to pick up names changed by other processes.
+AUTOCOMPLETE_CACHE_TTL = config('AUTOCOMPLETE_CACHE_TTL', default=30, cast=int)
+AUTOCOMPLETE_RELOAD = config('AUTOCOMPLETE_RELOAD', default=300, cast=int)
+
+# DM notifications (group.models.Notification): messages from the same sender
+# within this window share one entry; at most this many unread entries are
+# replayed when a notification socket connects.
+NOTIFICATION_COALESCE_SECONDS = config('NOTIFICATION_COALESCE_SECONDS', default=120, cast=int)
+NOTIFICATION_REPLAY_LIMIT = config('NOTIFICATION_REPLAY_LIMIT', default=50, cast=int)
+
+# Per-connection WebSocket send queues (group/backpressure.py): frames
+# buffered per socket, and what happens when a slow client fills them:
+# drop_oldest, coalesce or disconnect (close code 4008; clients reconnect).
+WS_SEND_QUEUE_SIZE = config('WS_SEND_QUEUE_SIZE', default=256, cast=int)
+WS_SEND_QUEUE_POLICY = config('WS_SEND_QUEUE_POLICY', default='coalesce')
+# Bytes the server may hold unsent for one socket before it is closed as slow.
+WS_TRANSPORT_BUFFER_MAX = config('WS_TRANSPORT_BUFFER_MAX', default=1048576, cast=int)
+
+# Compact (MessagePack) WebSocket frames: bodies from this size up are
+# deflated, and a client's deflated frame may inflate to at most this much.
+WS_COMPRESS_MIN_BYTES = config('WS_COMPRESS_MIN_BYTES', default=1024, cast=int)
+WS_INFLATE_MAX_BYTES = config('WS_INFLATE_MAX_BYTES', default=65536, cast=int)
+
 LOGIN_URL = '/users/login'
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+Batch polarity scoring with NumPy.
+
+TextBlob's PatternAnalyzer tokenizes and walks its lexicon in pure Python for
+every string, which dominates the cost of bulk scoring. BatchSentiment uses the
+same lexicon (textblob's en-sentiment.xml, averaged the same way) but scores a
+whole list of texts at once: all tokens go into one flat array, are mapped to
+lexicon ids with a single searchsorted, and the pattern rules are applied as
+array operations:
+
+- a known adverb (RB) multiplies the next known word's polarity by its
+  intensity, across unknown words of up to two letters ("really is a good");
+- a preceding "no"/"not"/"never" flips and halves the assessment
+  ("not good" = -0.5 * good) and inverts a negated modifier's intensity,
+  and "really not good" negates the chunk the -ly adverb starts;
+- every "!" after an assessment boosts it by 1.25;
+- emoticons (and the "(!)" irony marker) count as assessments of their own;
+- polarity is the mean over the assessments, 0.0 when there are none.
+
+Agreement with TextBlob: on chatbot/data/sentiment_corpus.txt every text must
+be within TOLERANCE of TextBlob's polarity (`manage.py bench_sentiment` checks
+this and reports throughput). The tokenizer is a close approximation of
+pattern's find_tokens rather than a port of it, which is where the remaining
+differences on free text come from.
+"""
+import re
+from itertools import chain
+
+import numpy as np
+
+TOLERANCE = 0.05
+
+NEGATIONS = ("no", "not", "n't", "never")
+EXCLAMATION_BOOST = 1.25
+
+
+class BatchSentiment:
+    def __init__(self):
+        from textblob.en import sentiment as pattern_sentiment
+        from textblob._text import EMOTICONS
+
+        len(pattern_sentiment)  # lazydict: forces the XML lexicon to load
+
+        entries = {}
+        for word, senses in dict.items(pattern_sentiment):
+            p, s, i = senses[None]
+            entries[word] = (p, i, "RB" in senses, True)
+        for (_type, p), faces in EMOTICONS.items():
+            for face in faces:
+                entries.setdefault(face.lower(), (p, 1.0, False, False))
+        entries["(!)"] = (0.0, 1.0, False, False)  # irony marker
+
+        vocab = sorted(entries)
+        self._vocab = np.array(vocab)
+        self._polarity = np.array([entries[w][0] for w in vocab], dtype=np.float64)
+        self._intensity = np.array([entries[w][1] for w in vocab], dtype=np.float64)
+        self._is_modifier = np.array([entries[w][2] for w in vocab], dtype=bool)
+        self._is_word = np.array([entries[w][3] for w in vocab], dtype=bool)
+
+        faces = sorted((w for w in vocab if not entries[w][3]), key=len, reverse=True)
+        self._token_re = re.compile(
+            "|".join(re.escape(f) for f in faces)
+            + r"|\.\.\.|(?:[a-z]\.){2,}|\w+(?:-\w+)*|[^\w\s]"
+        )
+
+    def tokenize(self, text):
+        return self._token_re.findall(text.lower())
+
+    def polarities(self, texts):
+        """Polarity of each text, as a float64 array in the same order."""
+        n = len(texts)
+        token_lists = [self.tokenize(t) for t in texts]
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=n)
+        total = int(lengths.sum())
+        result = np.zeros(n)
+        if total == 0:
+            return result
+
+        tokens = np.array(list(chain.from_iterable(token_lists)))
+        doc = np.repeat(np.arange(n), lengths)
+        doc_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pos = np.arange(total)
+
+        def last_before(mask):
+            # For each position, the index of the nearest earlier position in
+            # the same text where `mask` holds, or -1.
+            marked = np.where(mask, pos, -1)
+            prev = np.empty(total, dtype=np.int64)
+            prev[0] = -1
+            prev[1:] = np.maximum.accumulate(marked)[:-1]
+            prev[prev < doc_start] = -1
+            return prev
+
+        # Token ids.
+        idx = np.searchsorted(self._vocab, tokens)
+        idx[idx == len(self._vocab)] = 0
+        found = self._vocab[idx] == tokens
+        known = found & self._is_word[idx]
+        emoticon = found & ~self._is_word[idx]
+        polarity = np.where(found, self._polarity[idx], 0.0)
+        intensity = np.where(found, self._intensity[idx], 1.0)
+        modifier = known & self._is_modifier[idx]
+        negation = np.isin(tokens, NEGATIONS)
+        length = np.char.str_len(tokens)
+
+        # Modifiers: the previous known word is an adverb and nothing longer
+        # than two letters sits between them.
+        prev_known = last_before(known)
+        has_prev = prev_known >= 0
+        prev_safe = np.where(has_prev, prev_known, 0)
+        blocker = ~known & (length > 2)
+        pending = has_prev & modifier[prev_safe] & (last_before(blocker) < prev_known)
+
+        # "really not good": a negation right after an -ly modifier negates
+        # the modifier's chunk and leaves the modifier pending.
+        ly_negation = ~known & negation & pending & np.char.endswith(tokens[prev_safe], "ly")
+        blocker &= ~ly_negation
+        merge = known & has_prev & modifier[prev_safe] & (last_before(blocker) < prev_known)
+
+        # Negation: the last negation word is closer than anything that
+        # would have cleared it.
+        clears = ly_negation | (known & ~negation) | (
+            ~known & ~negation & (np.char.str_len(np.char.strip(tokens, "'")) > 1)
+        )
+        last_neg = last_before(negation & ~ly_negation)
+        negated = known & (last_neg >= 0) & (last_neg > last_before(clears))
+
+        intensity = np.where(negated, 1.0 / intensity, intensity)
+        scaled = np.clip(polarity * intensity[prev_safe], -1.0, 1.0)
+        polarity = np.where(merge, scaled, polarity)
+
+        # Group assessments: a merged word joins the chunk of the word it
+        # modifies, and the chunk's score is that of its last word.
+        assess = known | emoticon
+        a_pos = np.flatnonzero(assess)
+        if a_pos.size == 0:
+            return result
+        seg = np.cumsum(~merge[a_pos]) - 1
+        nseg = int(seg[-1]) + 1
+        seg_last = np.full(nseg, -1, dtype=np.int64)
+        np.maximum.at(seg_last, seg, a_pos)
+        seg_score = polarity[seg_last]
+        seg_of = np.full(total, -1, dtype=np.int64)
+        seg_of[a_pos] = seg
+        seg_negated = np.bincount(seg, weights=negated[a_pos], minlength=nseg) > 0
+        seg_negated[seg_of[prev_known[ly_negation]]] = True
+
+        # "!" boosts the latest assessment, if no later word replaced it.
+        bangs = np.flatnonzero(tokens == "!")
+        target = last_before(assess)[bangs]
+        target = target[target >= 0]
+        target = target[seg_last[seg_of[target]] == target]
+        boosts = np.bincount(seg_of[target], minlength=nseg)
+        seg_score = np.clip(seg_score * EXCLAMATION_BOOST ** boosts, -1.0, 1.0)
+
+        seg_score = np.where(seg_negated, seg_score * -0.5, seg_score)
+
+        seg_doc = doc[seg_last]
+        sums = np.bincount(seg_doc, weights=seg_score, minlength=n)
+        counts = np.bincount(seg_doc, minlength=n)
+        np.divide(sums, counts, out=result, where=counts > 0)
+        return result
+
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = BatchSentiment()
+    return _engine
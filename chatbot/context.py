@@ -0,0 +1,150 @@
+"""
+Conversation context for the chatbot.
+
+Each turn sends as many recent exchanges as fit in CHAT_CONTEXT_TOKENS, plus a
+compact rolling summary of everything older (ConversationSummary). Exchanges
+that fall out of the window are folded into the summary in batches of
+CHAT_SUMMARY_BATCH, so the summary grows incrementally and the request size
+stays flat however long the conversation runs.
+
+Folding calls the model, so it never runs while a reply is pending: each
+endpoint calls schedule_fold() after storing its turn, and a background
+thread does the folding.
+"""
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import llm
+from .models import ChatMessage, ConversationSummary
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a short running summary of a supportive conversation between a user "
+    "and HealChat AI. Merge the new exchanges into the current summary. Keep what matters "
+    "for future replies: the user's situation, feelings, coping strategies already tried "
+    "and any safety concerns. Reply with the updated summary only, in under {words} words."
+)
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English-like text; good enough
+    # for budgeting without shipping a tokenizer.
+    return len(text) // 4 + 1
+
+
+def turn_tokens(msg):
+    return estimate_tokens(msg.message) + estimate_tokens(msg.response)
+
+
+def _window(user_id, summary):
+    """The newest uncovered turns that fit the token budget, newest first."""
+    candidates = (
+        ChatMessage.objects.filter(user_id=user_id, id__gt=summary.covered_until_id)
+        .order_by('-created_at', '-id')[:settings.CHAT_CONTEXT_MAX_TURNS]
+    )
+    budget = settings.CHAT_CONTEXT_TOKENS - estimate_tokens(summary.summary)
+    window = []
+    for msg in candidates:
+        cost = turn_tokens(msg)
+        if cost > budget:
+            break
+        budget -= cost
+        window.append(msg)
+    return window
+
+
+def build_context(user):
+    """
+    Returns {"summary": str, "turns": [ChatMessage, ...]} with the turns
+    oldest first. Never calls the model: folding happens after the reply,
+    see schedule_fold.
+    """
+    summary, _ = ConversationSummary.objects.get_or_create(user=user)
+    return {"summary": summary.summary, "turns": _window(user.id, summary)[::-1]}
+
+
+def fold_pending(user_id):
+    """
+    Folds every uncovered turn older than the current window into the
+    summary, oldest first, once at least CHAT_SUMMARY_BATCH of them have
+    piled up. Each model call takes at most CHAT_CONTEXT_MAX_TURNS turns.
+    """
+    summary, _ = ConversationSummary.objects.get_or_create(user_id=user_id)
+    while True:
+        window = _window(user_id, summary)
+        overflow = ChatMessage.objects.filter(user_id=user_id, id__gt=summary.covered_until_id)
+        if window:
+            overflow = overflow.filter(id__lt=min(m.id for m in window))
+        turns = list(overflow.order_by('id')[:settings.CHAT_CONTEXT_MAX_TURNS])
+        if len(turns) < settings.CHAT_SUMMARY_BATCH or not fold_into_summary(summary, turns):
+            return
+
+
+def fold_into_summary(summary, turns):
+    """
+    Extends the summary with `turns` (oldest first) and advances its cursor.
+    False if the model call failed or another process folded first.
+    """
+    transcript = "\n".join(f"User: {m.message}\nHealChat AI: {m.response}" for m in turns)
+    words = settings.CHAT_SUMMARY_TOKENS * 3 // 4
+    payload = {
+        "system_instruction": {"parts": [{"text": SUMMARY_INSTRUCTION.format(words=words)}]},
+        "contents": [{"role": "user", "parts": [{"text": (
+            f"Current summary:\n{summary.summary or '(none yet)'}\n\nNew exchanges:\n{transcript}"
+        )}]}],
+    }
+    try:
+        text = llm.generate(payload)
+    except Exception as e:
+        # Leave the cursor where it is; the same turns are retried next time.
+        print(f"Summary Error: {e}")
+        return False
+
+    text = text.strip()[:settings.CHAT_SUMMARY_TOKENS * 4]
+    # Only advance from the cursor this summary was built on.
+    moved = ConversationSummary.objects.filter(
+        pk=summary.pk, covered_until_id=summary.covered_until_id
+    ).update(summary=text, covered_until_id=turns[-1].id, updated_at=timezone.now())
+    if moved:
+        summary.summary, summary.covered_until_id = text, turns[-1].id
+    return bool(moved)
+
+
+class Folder:
+    """Runs fold_pending off the request path, on one daemon thread per process."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+
+    def schedule(self, user_id):
+        with self._cond:
+            if user_id not in self._pending:
+                self._pending.append(user_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-summary", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                user_id = self._pending.pop(0)
+            try:
+                close_old_connections()
+                fold_pending(user_id)
+            except Exception as e:
+                print(f"Summary Error: {e}")
+
+
+_folder = Folder()
+
+
+def schedule_fold(user_id):
+    """Queues fold_pending for `user_id`; call it once the reply has been stored."""
+    _folder.schedule(user_id)
@@ -0,0 +1,456 @@
+"""
+Gateway to the Gemini API.
+
+Every chatbot turn goes through here rather than calling the API directly:
+
+- Connections are pooled: one keep-alive httpx.AsyncClient per event loop for
+  the async views and one requests.Session for the sync ones, with
+  connect/read timeouts and a cap on calls in flight (UpstreamBusy when no
+  slot frees up in time).
+- 429s, 5xx and transport errors are retried a bounded number of times with
+  jittered exponential backoff.
+- A circuit breaker opens after repeated failures and rejects calls
+  immediately (CircuitOpen) until a trial call succeeds, so a brownout sheds
+  load instead of piling up blocked workers.
+- Replies are kept in an LRU/TTL cache keyed on the full payload (history
+  plus prompt).
+
+stats() returns the counters (cache hits, breaker trips, latency, ...).
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamBusy(Exception):
+    """Raised when no in-flight slot frees up within LLM_QUEUE_TIMEOUT."""
+
+
+class CircuitOpen(Exception):
+    """Raised while the breaker is open and upstream calls are being shed."""
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def api_headers():
+    return {
+        "X-goog-api-key": settings.API_KEY,
+        "Content-Type": "application/json",
+    }
+
+
+def extract_text(data):
+    """Pull the reply text out of a Gemini response (or one streamed chunk of it)."""
+    try:
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+# ------------------------------------------------------------ bookkeeping
+
+class Stats:
+    COUNTERS = ("requests", "cache_hits", "cache_misses", "upstream_calls", "retries",
+                "failures", "breaker_trips", "short_circuited", "busy")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.COUNTERS, 0)
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def observe(self, seconds):
+        with self._lock:
+            self._latency_total += seconds
+            self._latency_max = max(self._latency_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self._counts)
+            calls = data["upstream_calls"]
+            data["latency_avg_ms"] = round(1000 * self._latency_total / calls, 1) if calls else 0.0
+            data["latency_max_ms"] = round(1000 * self._latency_max, 1)
+        return data
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures. While open, calls
+    are rejected until `reset_after` seconds pass; then a single trial call is
+    let through (half-open) and its outcome closes or re-opens the breaker.
+    A trial that ends without recording an outcome (cancelled, or failed with
+    anything but UpstreamError) counts as failed; see after_call.
+    """
+
+    def __init__(self, threshold, reset_after, stats):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """True if this call is the half-open trial. Pair with after_call in a finally."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_after and not self._trial_running:
+                self._trial_running = True
+                return True
+        self.stats.incr("short_circuited")
+        raise CircuitOpen("upstream marked unhealthy; failing fast")
+
+    def after_call(self, trial):
+        with self._lock:
+            if trial and self._trial_running:
+                self._trip()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or (self._opened_at is None and self._failures >= self.threshold):
+                self._trip()
+
+    def _trip(self):
+        self._trial_running = False
+        self._opened_at = time.monotonic()
+        self.stats.incr("breaker_trips")
+
+
+class ReplyCache:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    @staticmethod
+    def key(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+_stats = Stats()
+_breaker = None
+_cache = None
+
+
+def _guards():
+    global _breaker, _cache
+    if _breaker is None:
+        _breaker = CircuitBreaker(settings.LLM_BREAKER_THRESHOLD, settings.LLM_BREAKER_RESET, _stats)
+        _cache = ReplyCache(settings.LLM_CACHE_SIZE, settings.LLM_CACHE_TTL)
+    return _breaker, _cache
+
+
+def stats():
+    breaker, cache = _guards()
+    data = _stats.snapshot()
+    data["breaker_state"] = breaker.state
+    return data
+
+
+def _backoff(attempt):
+    delay = min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _check_status(status_code):
+    if status_code >= 400:
+        raise UpstreamError(f"upstream returned HTTP {status_code}", retryable=status_code in RETRY_STATUSES)
+
+
+def _json(response):
+    try:
+        return response.json()
+    except ValueError:
+        raise UpstreamError("upstream returned invalid JSON", retryable=True)
+
+
+def _reply_text(data):
+    text = extract_text(data)
+    if not text:
+        raise UpstreamError("upstream returned no reply text")
+    return text
+
+
+# ---------------------------------------------------------------- async side
+
+# httpx clients and asyncio semaphores belong to the loop they were created
+# on, so keep one pair per running loop (normally just Daphne's).
+_async_pools = weakref.WeakKeyDictionary()
+
+
+def _async_pool():
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.LLM_READ_TIMEOUT,
+                connect=settings.LLM_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_INFLIGHT,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE,
+            ),
+            headers=api_headers(),
+        )
+        pool = (client, asyncio.Semaphore(settings.LLM_MAX_INFLIGHT))
+        _async_pools[loop] = pool
+    return pool
+
+
+async def _acquire(semaphore):
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=settings.LLM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats.incr("busy")
+        raise UpstreamBusy("too many chatbot requests in flight")
+
+
+async def _apost(client, payload):
+    started = time.monotonic()
+    _stats.incr("upstream_calls")
+    try:
+        response = await client.post(settings.API_URL, json=payload)
+    except httpx.TransportError as e:
+        raise UpstreamError(str(e), retryable=True)
+    finally:
+        _stats.observe(time.monotonic() - started)
+    _check_status(response.status_code)
+    return _reply_text(_json(response))
+
+
+async def agenerate(payload):
+    """Reply text for `payload`, from the cache or the API."""
+    breaker, cache = _guards()
+    _stats.incr("requests")
+    key = cache.key(payload)
+    cached = cache.get(key)
+    if cached is not None:
+        _stats.incr("cache_hits")
+        return cached
+    _stats.incr("cache_misses")
+
+    client, semaphore = _async_pool()
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        trial = breaker.before_call()
+        try:
+            await _acquire(semaphore)
+            try:
+                text = await _apost(client, payload)
+            except UpstreamError as e:
+                if e.retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not e.retryable or attempt == settings.LLM_MAX_RETRIES:
+                    _stats.incr("failures")
+                    raise
+            else:
+                breaker.record_success()
+                cache.set(key, text)
+                return text
+            finally:
+                semaphore.release()
+        finally:
+            breaker.after_call(trial)
+        _stats.incr("retries")
+        await asyncio.sleep(_backoff(attempt))
+
+
+async def astream(payload):
+    """
+    Yields reply text chunks from streamGenerateContent (alt=sse). Retries
+    only happen before the first chunk; a cached reply comes back as a single
+    chunk.
+    """
+    breaker, cache = _guards()
+    _stats.incr("requests")
+    key = cache.key(payload)
+    cached = cache.get(key)
+    if cached is not None:
+        _stats.incr("cache_hits")
+        yield cached
+        return
+    _stats.incr("cache_misses")
+
+    client, semaphore = _async_pool()
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        trial = breaker.before_call()
+        try:
+            await _acquire(semaphore)
+            chunks = []
+            started = time.monotonic()
+            _stats.incr("upstream_calls")
+            try:
+                async with client.stream("POST", settings.API_STREAM_URL, json=payload) as response:
+                    _check_status(response.status_code)
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        try:
+                            data = json.loads(line[5:].strip())
+                        except ValueError:
+                            raise UpstreamError("upstream sent an invalid stream event", retryable=True)
+                        text = extract_text(data)
+                        if text:
+                            chunks.append(text)
+                            yield text
+            except (UpstreamError, httpx.TransportError) as e:
+                retryable = getattr(e, "retryable", True)
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if chunks or not retryable or attempt == settings.LLM_MAX_RETRIES:
+                    _stats.incr("failures")
+                    raise
+            else:
+                breaker.record_success()
+                cache.set(key, "".join(chunks))
+                return
+            finally:
+                _stats.observe(time.monotonic() - started)
+                semaphore.release()
+        finally:
+            breaker.after_call(trial)
+        _stats.incr("retries")
+        await asyncio.sleep(_backoff(attempt))
+
+
+# ----------------------------------------------------------------- sync side
+
+_session = None
+_session_lock = threading.Lock()
+_sync_slots = None
+
+
+def _sync_pool():
+    global _session, _sync_slots
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=settings.LLM_MAX_KEEPALIVE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(api_headers())
+                _sync_slots = threading.BoundedSemaphore(settings.LLM_MAX_INFLIGHT)
+                _session = session
+    return _session, _sync_slots
+
+
+def _post(session, payload):
+    started = time.monotonic()
+    _stats.incr("upstream_calls")
+    try:
+        response = session.post(
+            settings.API_URL,
+            json=payload,
+            timeout=(settings.LLM_CONNECT_TIMEOUT, settings.LLM_READ_TIMEOUT),
+        )
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise UpstreamError(str(e), retryable=True)
+    finally:
+        _stats.observe(time.monotonic() - started)
+    _check_status(response.status_code)
+    return _reply_text(_json(response))
+
+
+def generate(payload):
+    """Blocking version of agenerate for the sync views."""
+    breaker, cache = _guards()
+    _stats.incr("requests")
+    key = cache.key(payload)
+    cached = cache.get(key)
+    if cached is not None:
+        _stats.incr("cache_hits")
+        return cached
+    _stats.incr("cache_misses")
+
+    session, slots = _sync_pool()
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        trial = breaker.before_call()
+        try:
+            if not slots.acquire(timeout=settings.LLM_QUEUE_TIMEOUT):
+                _stats.incr("busy")
+                raise UpstreamBusy("too many chatbot requests in flight")
+            try:
+                text = _post(session, payload)
+            except UpstreamError as e:
+                if e.retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not e.retryable or attempt == settings.LLM_MAX_RETRIES:
+                    _stats.incr("failures")
+                    raise
+            else:
+                breaker.record_success()
+                cache.set(key, text)
+                return text
+            finally:
+                slots.release()
+        finally:
+            breaker.after_call(trial)
+        _stats.incr("retries")
+        time.sleep(_backoff(attempt))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from chatbot.models import ChatMessage
+from chatbot.sentiment import score_texts
+from group.models import GroupMessage, DirectMessage
+
+
+class Command(BaseCommand):
+    help = "Scores historical messages that were saved before polarity was stored on the row."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        targets = [
+            (ChatMessage, "message"),
+            (GroupMessage, "content"),
+            (DirectMessage, "content"),
+        ]
+        for model, text_field in targets:
+            total = self.backfill(model, text_field, batch_size)
+            self.stdout.write(f"{model.__name__}: scored {total} rows")
+
+    def backfill(self, model, text_field, batch_size):
+        total = 0
+        last_id = 0
+        while True:
+            # Walk by primary key so each batch is an indexed range scan and
+            # rows scored by the previous batch are never revisited.
+            batch = list(
+                model.objects.filter(polarity__isnull=True, id__gt=last_id)
+                .order_by("id")
+                .only("id", text_field)[:batch_size]
+            )
+            if not batch:
+                return total
+            scores = score_texts([getattr(row, text_field) for row in batch])
+            for row, polarity in zip(batch, scores):
+                row.polarity = polarity
+            model.objects.bulk_update(batch, ["polarity"])
+            last_id = batch[-1].id
+            total += len(batch)
@@ -0,0 +1,50 @@
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from textblob import TextBlob
+
+from chatbot.batch_sentiment import BatchSentiment, TOLERANCE
+
+CORPUS = Path(__file__).resolve().parents[2] / "data" / "sentiment_corpus.txt"
+
+
+class Command(BaseCommand):
+    help = "Checks BatchSentiment against TextBlob on the fixture corpus and compares their speed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50,
+                            help="How many copies of the corpus to score for the timing run.")
+
+    def handle(self, *args, **options):
+        texts = CORPUS.read_text(encoding="utf-8").splitlines()
+        engine = BatchSentiment()
+
+        reference = np.array([TextBlob(t).sentiment.polarity for t in texts])
+        ours = engine.polarities(texts)
+        diff = np.abs(reference - ours)
+        self.stdout.write(
+            f"Agreement on {len(texts)} texts: max |diff| {diff.max():.4f}, "
+            f"mean {diff.mean():.4f}, tolerance {TOLERANCE}"
+        )
+        for i in np.flatnonzero(diff > TOLERANCE):
+            self.stdout.write(f"  textblob {reference[i]:+.3f}  batch {ours[i]:+.3f}  {texts[i]!r}")
+
+        bulk = texts * options["repeat"]
+
+        start = time.perf_counter()
+        for t in bulk:
+            TextBlob(t).sentiment.polarity
+        textblob_secs = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine.polarities(bulk)
+        batch_secs = time.perf_counter() - start
+
+        self.stdout.write(f"TextBlob: {len(bulk) / textblob_secs:,.0f} texts/s")
+        self.stdout.write(f"Batch:    {len(bulk) / batch_secs:,.0f} texts/s "
+                          f"({textblob_secs / batch_secs:.1f}x)")
+
+        if diff.max() > TOLERANCE:
+            raise CommandError("BatchSentiment drifted outside the documented tolerance")
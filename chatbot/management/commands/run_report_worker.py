@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chatbot.reports import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Generates queued AnalysisReports in the background."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--stale-after", type=int, default=300,
+                            help="Seconds after which a running job is assumed dead and retried.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        self.stdout.write("Report worker started")
+        while True:
+            close_old_connections()
+            job = claim_next_job(stale_after)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+                continue
+            try:
+                run_job(job)
+            except Exception as e:
+                print(f"Report job error for user {job.user_id}: {e}")
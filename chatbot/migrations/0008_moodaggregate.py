@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_chatmessage_polarity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('windows', models.JSONField(default=dict)),
+                ('window_sum', models.FloatField(default=0.0)),
+                ('window_count', models.IntegerField(default=0)),
+                ('window_negative', models.IntegerField(default=0)),
+                ('ewma', models.FloatField(blank=True, null=True)),
+                ('total_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mood_aggregate', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 class ChatMessage(models.Model):
@@ -7,8 +7,12 @@ class ChatMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     emotion = models.CharField(max_length=20, default="Neutral")  
+    polarity = models.FloatField(null=True, blank=True)
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='chatmsg_user_created_id'),
+        ]
     
     def __str__(self):
         return self.message[0:30]+'...'
@@ -21,3 +25,137 @@ class AnalysisReport(models.Model):
     summary = models.TextField(null=True, blank=True)
     risk_level = models.CharField(max_length=20, default="Low")
     timestamp = models.DateTimeField(auto_now_add=True)
+
+
+class MoodAggregate(models.Model):
+    """
+    Running mood state for one user, updated as each message is saved so that
+    generating an AnalysisReport is a single-row read.
+
+    `windows` keeps the latest WINDOW polarities per source (oldest first),
+    which is the same "latest 20 chatbot + 20 group + 20 direct" sample the
+    analysis used to query for. Sum/count/negatives over that sample are kept
+    alongside, plus an exponentially weighted mood over every message.
+    """
+    WINDOW = 20
+    SOURCES = ("chat", "group", "direct")
+    EWMA_ALPHA = 0.1
+    MIN_SAMPLES = 5
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="mood_aggregate")
+    windows = models.JSONField(default=dict)
+    window_sum = models.FloatField(default=0.0)
+    window_count = models.IntegerField(default=0)
+    window_negative = models.IntegerField(default=0)
+    ewma = models.FloatField(null=True, blank=True)
+    total_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def push(self, source, polarity):
+        window = self.windows.setdefault(source, [])
+        window.append(polarity)
+        self.window_sum += polarity
+        self.window_count += 1
+        self.window_negative += polarity < 0
+
+        if len(window) > self.WINDOW:
+            evicted = window.pop(0)
+            self.window_sum -= evicted
+            self.window_count -= 1
+            self.window_negative -= evicted < 0
+
+        if self.ewma is None:
+            self.ewma = polarity
+        else:
+            self.ewma = self.EWMA_ALPHA * polarity + (1 - self.EWMA_ALPHA) * self.ewma
+        self.total_count += 1
+
+    def average(self):
+        """Mean polarity over the window, or None if there is too little to go on."""
+        if self.window_count < self.MIN_SAMPLES:
+            return None
+        return self.window_sum / self.window_count
+
+    @classmethod
+    def record(cls, user, source, polarity):
+        with transaction.atomic():
+            agg = cls.objects.select_for_update().filter(user=user).first()
+            if agg is None:
+                # First message we have seen for this user since aggregates
+                # were introduced; the new row is already in the DB, so the
+                # rebuild picks it up.
+                cls.rebuild(user)
+                return
+            agg.push(source, polarity)
+            agg.save()
+
+    @classmethod
+    def for_user(cls, user):
+        agg = cls.objects.filter(user=user).first()
+        if agg is None:
+            agg = cls.rebuild(user)
+        return agg
+
+    @classmethod
+    def rebuild(cls, user):
+        """Recomputes the aggregate from the message tables (three ordered queries)."""
+        from group.models import GroupMessage, DirectMessage
+        from .sentiment import score_texts
+
+        sources = {
+            "chat": ChatMessage.objects.filter(user=user).order_by('-created_at')
+                    .values_list("message", "polarity", "created_at"),
+            "group": GroupMessage.objects.filter(sender=user).order_by('-timestamp')
+                     .values_list("content", "polarity", "timestamp"),
+            "direct": DirectMessage.objects.filter(sender=user).order_by('-timestamp')
+                      .values_list("content", "polarity", "timestamp"),
+        }
+        rows = []
+        for source, qs in sources.items():
+            for text, polarity, ts in qs[:cls.WINDOW]:
+                if text.strip():
+                    rows.append([ts, source, polarity, text])
+
+        unscored = [row for row in rows if row[2] is None]
+        if unscored:
+            for row, polarity in zip(unscored, score_texts([row[3] for row in unscored])):
+                row[2] = polarity
+        rows.sort(key=lambda r: r[0])
+
+        agg, _ = cls.objects.get_or_create(user=user)
+        agg.windows = {}
+        agg.window_sum = 0.0
+        agg.window_count = 0
+        agg.window_negative = 0
+        agg.ewma = None
+        agg.total_count = 0
+        for ts, source, polarity, text in rows:
+            agg.push(source, polarity)
+        agg.save()
+        return agg
+
+
+class ReportJob(models.Model):
+    """Queued AnalysisReport refresh; at most one per user (see chatbot.reports)."""
+    PENDING = "pending"
+    RUNNING = "running"
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="report_job")
+    status = models.CharField(max_length=10, default=PENDING)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "requested_at"])]
+
+
+class ConversationSummary(models.Model):
+    """
+    Rolling summary of a user's older chatbot turns. `covered_until_id` is
+    the newest ChatMessage folded into it; the summary is only ever extended
+    with turns after that, never regenerated from scratch.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="chat_summary")
+    summary = models.TextField(blank=True, default="")
+    covered_until_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
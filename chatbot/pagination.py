@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination over (timestamp, id).
+
+Pages are fetched with `WHERE (ts, id) < (cursor_ts, cursor_id) ORDER BY ts
+DESC, id DESC LIMIT n`, which a (owner, ts, id) index answers with a short
+range scan, so page 1000 costs the same as page 1. Cursors are opaque
+url-safe strings.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(ts, pk):
+    raw = f"{ts.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) for a cursor string; ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def parse_limit(value, default=50, maximum=100):
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+def keyset_page(qs, time_field, cursor=None, limit=50):
+    """
+    One page of `qs`, newest first before `cursor` (or the newest page when
+    cursor is None). Returns (rows oldest-first, cursor for the next older
+    page or None).
+    """
+    if cursor:
+        ts, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(**{f"{time_field}__lt": ts}) | Q(**{time_field: ts, "id__lt": pk}))
+
+    rows = list(qs.order_by(f"-{time_field}", "-id")[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, time_field), last.id)
+    return rows[::-1], next_cursor
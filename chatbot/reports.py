@@ -0,0 +1,86 @@
+"""
+AnalysisReport generation.
+
+Reports are produced by the background worker (`manage.py run_report_worker`),
+not inside the HTTP request. AnalysisAPIView only reads the latest reports and,
+when they are stale, calls enqueue_report(). ReportJob has one row per user at
+most, so however many tabs poll at once there is never more than one
+computation queued or running for a user.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import AnalysisReport, MoodAggregate, ReportJob
+
+REPORT_INTERVAL = timedelta(seconds=45)
+
+
+def compute_scores(avg_polarity):
+    mood = int((avg_polarity + 1) * 50) 
+    stress = 100 - mood
+    negative = 100 if avg_polarity < 0 else 0
+    
+    return mood, stress, negative
+
+def calculate_risk(stress, negative):
+    if stress > 80 or negative > 70: return "High"
+    elif stress > 50 or negative > 40: return "Medium"
+    return "Low"
+
+
+def is_stale(last_report):
+    return last_report is None or (timezone.now() - last_report.timestamp) >= REPORT_INTERVAL
+
+
+def enqueue_report(user):
+    # INSERT ... ON CONFLICT DO NOTHING: a job already queued or running for
+    # this user absorbs the request.
+    ReportJob.objects.bulk_create([ReportJob(user=user)], ignore_conflicts=True)
+
+
+def generate_report(user):
+    avg_polarity = MoodAggregate.for_user(user).average()
+    if avg_polarity is None:
+        return None
+
+    mood, stress, negative = compute_scores(avg_polarity)
+    risk = calculate_risk(stress, negative)
+
+    return AnalysisReport.objects.create(
+        user=user,
+        mood_score=mood,
+        stress_level=stress,
+        negative_percentage=negative,
+        risk_level=risk 
+    )
+
+
+def claim_next_job(stale_after):
+    """
+    Marks the oldest pending job (or one whose worker died mid-run) as running
+    and returns it, or None if the queue is empty. The conditional UPDATE makes
+    the claim safe with several workers.
+    """
+    now = timezone.now()
+    candidates = ReportJob.objects.filter(status=ReportJob.PENDING) | ReportJob.objects.filter(
+        status=ReportJob.RUNNING, started_at__lt=now - stale_after
+    )
+    for job in candidates.order_by("requested_at")[:10]:
+        claimed = ReportJob.objects.filter(id=job.id, status=job.status, started_at=job.started_at).update(
+            status=ReportJob.RUNNING, started_at=now
+        )
+        if claimed:
+            job.status, job.started_at = ReportJob.RUNNING, now
+            return job
+    return None
+
+
+def run_job(job):
+    try:
+        # Skip the work if a report was written since the job was queued.
+        last_report = AnalysisReport.objects.filter(user_id=job.user_id).order_by('-timestamp').first()
+        if is_stale(last_report):
+            generate_report(job.user)
+    finally:
+        ReportJob.objects.filter(id=job.id).delete()
@@ -0,0 +1,189 @@
+"""
+Risk keyword lexicon and the matcher built from it.
+
+The matcher is an Aho-Corasick automaton compiled once at import time, so a
+message is scanned in a single pass however many phrases the lexicon holds.
+Hits only count on word boundaries ("die" does not fire inside "diet") and
+overlapping hits resolve to the leftmost, longest phrase ("kill myself" wins
+over "kill"). Negative single-word entries also match their regular
+inflections ("killing", "dying", "hopelessly", "saddest", "worthlessness"),
+generated by inflections() when the automaton is compiled.
+
+RISK_MATCHER is the one shared instance; the chatbot, the analysis code and
+anything scanning group/DM text should use it rather than building their own.
+"""
+import unicodedata
+from collections import deque, namedtuple
+
+# phrase -> (polarity, subjectivity)
+RISK_KEYWORDS = {
+    'stressed': (-0.8, 1.0),
+    'anxious': (-0.8, 1.0),
+    'depressed': (-1.0, 1.0),   'suicidal': (-1.0, 1.0),
+        'kill': (-1.0, 1.0),        'die': (-1.0, 1.0),
+        'pain': (-0.8, 1.0),        'lonely': (-0.7, 1.0),
+        'overwhelmed': (-0.5, 1.0), 'sad': (-0.7, 1.0),
+        'angry': (-0.5, 1.0),       'horrible': (-0.9, 1.0),
+        'terrible': (-0.9, 1.0),    'hopeless': (-1.0, 1.0),
+        'happy': (0.8, 1.0),        'excited': (0.8, 1.0),
+        'calm': (0.5, 1.0),         'better': (0.5, 1.0),
+        'good': (0.6, 1.0),         'great': (0.8, 1.0),
+        "kill myself": (-1.0, 1.0), "empty": (-0.7, 1.0), "worthless": (-1.0, 1.0),
+        "marne ka mann": (-1.0, 1.0), "marna": (-1.0, 1.0),
+        "jeene ka mann nahi": (-1.0, 1.0), "zindagi se thak": (-0.9, 1.0),
+        "aatmahatya": (-1.0, 1.0), "dukhi": (-0.6, 1.0), "akela": (-0.7, 1.0),
+        "marva nu man": (-1.0, 1.0), "jeevti nathi": (-1.0, 1.0),
+        "dukhi chu": (-0.6, 1.0), "bhay lage chhe": (-0.6, 1.0),
+        # Forms inflections() cannot derive from the entries above.
+        "killing myself": (-1.0, 1.0), "killed myself": (-1.0, 1.0),
+        "suicide": (-1.0, 1.0),     "depression": (-1.0, 1.0),
+        "stress": (-0.8, 1.0),      "anxiety": (-0.8, 1.0),     "overwhelming": (-0.5, 1.0),
+}
+
+SUFFIXES = ("s", "ed", "ing", "er", "est", "ly", "ness", "ful")
+VOWELS = "aeiou"
+
+Hit = namedtuple("Hit", "phrase start end score subjectivity")
+
+
+def normalize(text):
+    """Lower-case and collapse runs of whitespace, as phrases are stored."""
+    return " ".join(text.lower().split())
+
+
+def inflections(word):
+    """
+    Regular English inflections of `word` (-s, -ed, -ing, -er, -est, -ly,
+    -ness, -ful) with the usual spelling changes: "die" -> "dying", "sad" ->
+    "saddest", "lonely" -> "loneliness", "terrible" -> "terribly".
+    """
+    if not word.isascii() or not word.isalpha() or len(word) < 3:
+        return set()
+    forms = set()
+    for suffix in SUFFIXES:
+        stem = word
+        if word.endswith("ie") and suffix == "ing":
+            stem = word[:-2] + "y"
+        elif word.endswith("le") and suffix == "ly":
+            stem = word[:-1]
+            suffix = "y"
+        elif word.endswith("e") and suffix[0] in "ei":
+            stem = word[:-1]
+        elif word.endswith("y") and word[-2] not in VOWELS and suffix != "ing":
+            stem = word[:-1] + "i"
+            if suffix == "s":
+                suffix = "es"
+        elif suffix[0] in VOWELS and sum(ch in VOWELS for ch in word) == 1 and \
+                word[-1] not in VOWELS + "wxy" and word[-2] in VOWELS:
+            # One-syllable consonant-vowel-consonant words double the last letter.
+            stem = word + word[-1]
+        elif suffix == "s" and word.endswith(("s", "sh", "ch", "x", "z")):
+            suffix = "es"
+        forms.add(stem + suffix)
+    forms.discard(word)
+    return forms
+
+
+def _is_word_char(ch):
+    # Letters, combining marks (Devanagari/Gujarati vowel signs) and digits.
+    return unicodedata.category(ch)[0] in "LMN"
+
+
+class RiskMatcher:
+    def __init__(self, lexicon):
+        lexicon = dict(lexicon)
+        for phrase, (score, subj) in list(lexicon.items()):
+            if score < 0:
+                for form in inflections(normalize(phrase)):
+                    lexicon.setdefault(form, (score, subj))
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]      # phrase ending exactly at this node
+        self._link = [0]        # nearest fail-ancestor that ends a phrase
+        self._lexicon = {}
+
+        for phrase, (score, subj) in lexicon.items():
+            phrase = normalize(phrase)
+            if not phrase:
+                continue
+            self._lexicon[phrase] = (score, subj)
+            node = 0
+            for ch in phrase:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                    self._link.append(0)
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._out[node] = phrase
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                f = self._goto[f].get(ch, 0)
+                self._fail[child] = f
+                self._link[child] = f if self._out[f] else self._link[f]
+
+    def __len__(self):
+        return len(self._lexicon)
+
+    def find_all(self, text):
+        """Every boundary-respecting hit in `text`, overlaps included."""
+        text = normalize(text)
+        goto, fail, out, link = self._goto, self._fail, self._out, self._link
+        hits = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            match = node if out[node] else link[node]
+            while match:
+                phrase = out[match]
+                start = i - len(phrase) + 1
+                end = i + 1
+                if (start == 0 or not _is_word_char(text[start - 1])) and \
+                        (end == len(text) or not _is_word_char(text[end])):
+                    score, subj = self._lexicon[phrase]
+                    hits.append(Hit(phrase, start, end, score, subj))
+                match = link[match]
+        return hits
+
+    def find(self, text):
+        """Non-overlapping hits, preferring the leftmost then the longest phrase."""
+        hits = sorted(self.find_all(text), key=lambda h: (h.start, -len(h.phrase)))
+        chosen = []
+        last_end = -1
+        for h in hits:
+            if h.start >= last_end:
+                chosen.append(h)
+                last_end = h.end
+        return chosen
+
+    def score(self, text):
+        """
+        Polarity override for `text`, or None when nothing in the lexicon
+        matches. When several phrases hit, any negative one wins (the most
+        negative of them), so "happy but want to kill myself" still scores
+        as risk; otherwise the strongest positive hit is used.
+        """
+        hits = self.find(text)
+        if not hits:
+            return None
+        lowest = min(h.score for h in hits)
+        if lowest < 0:
+            return lowest
+        return max(h.score for h in hits)
+
+
+RISK_MATCHER = RiskMatcher(RISK_KEYWORDS)
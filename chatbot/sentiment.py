@@ -0,0 +1,38 @@
+"""
+Message polarity scoring.
+
+Every chat/group/DM message is scored once, when it is written, and the
+result is stored on the row (`polarity`). Analysis reads those numbers
+instead of running TextBlob over the same texts again on every refresh.
+"""
+from textblob import TextBlob
+
+from .risk import RISK_MATCHER
+
+
+def score_text(text):
+    """Polarity in [-1, 1]: a risk-lexicon hit if there is one, else TextBlob."""
+    if not text or not text.strip():
+        return 0.0
+    polarity = RISK_MATCHER.score(text)
+    if polarity is None:
+        polarity = TextBlob(text).sentiment.polarity
+    return polarity
+
+
+def score_texts(texts):
+    """
+    Batch version of score_text for backfills and bulk analysis: the same
+    risk-lexicon override, with everything else scored in one NumPy pass.
+    """
+    from .batch_sentiment import get_engine
+
+    scores = get_engine().polarities(texts).tolist()
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            scores[i] = 0.0
+            continue
+        override = RISK_MATCHER.score(text)
+        if override is not None:
+            scores[i] = override
+    return scores
@@ -36,6 +36,13 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
         fields = '__all__'
+
+class ChatHistorySerializer(serializers.ModelSerializer):
+    """Just what the chat page renders; no user or scoring fields."""
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'message', 'response', 'emotion', 'created_at']
     
 class AnalysisReportSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from group.models import GroupMessage, DirectMessage
+from .models import ChatMessage, MoodAggregate
+from .sentiment import score_text
+
+
+def _record(user, source, text, polarity):
+    if user is None or not text.strip():
+        return
+    if polarity is None:
+        polarity = score_text(text)
+    try:
+        MoodAggregate.record(user, source, polarity)
+    except Exception as e:
+        # The message itself is saved; the aggregate can be rebuilt later.
+        print(f"Mood aggregate error: {e}")
+
+
+@receiver(post_save, sender=ChatMessage)
+def chat_message_saved(sender, instance, created, **kwargs):
+    if created:
+        _record(instance.user, "chat", instance.message, instance.polarity)
+
+
+@receiver(post_save, sender=GroupMessage)
+def group_message_saved(sender, instance, created, **kwargs):
+    if created:
+        _record(instance.sender, "group", instance.content, instance.polarity)
+
+
+@receiver(post_save, sender=DirectMessage)
+def direct_message_saved(sender, instance, created, **kwargs):
+    if created:
+        _record(instance.sender, "direct", instance.content, instance.polarity)
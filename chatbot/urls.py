@@ -7,5 +7,8 @@ urlpatterns = [
     path('chat/', views.chat_page, name='chat_page'),
     path('analysis/', views.analysis_page, name='analysis_page'),
     path('api/chat/', views.ChatAPIView.as_view(), name='api_chat'),
+    path('api/chat/stream/', views.chat_stream, name='api_chat_stream'),
+    path('api/chat/async/', views.AsyncChatAPIView.as_view(), name='api_chat_async'),
     path('api/reports/', views.AnalysisAPIView.as_view(), name='api_reports'),
+    path('api/llm/stats/', views.LLMStatsAPIView.as_view(), name='api_llm_stats'),
 ]
@@ -1,133 +1,94 @@
 import json
-import requests
-import textblob
-from textblob import TextBlob
-from textblob.sentiments import PatternAnalyzer
 from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from .models import ChatMessage, AnalysisReport
-from .serializers import MessageSerializer, AnalysisReportSerializer
-from group.models import GroupMessage, DirectMessage
-from datetime import timedelta
-from django.utils import timezone
+from .reports import enqueue_report, is_stale
+from .serializers import ChatHistorySerializer, AnalysisReportSerializer
+from .pagination import keyset_page, parse_limit
+from . import llm
+from .context import build_context, schedule_fold
+from .risk import RISK_KEYWORDS
+from .sentiment import score_text
 from django.shortcuts import render, redirect
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.utils.http import parse_etags, quote_etag
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 
-RISK_KEYWORDS = {
-    'stressed': (-0.8, 1.0),
-    'anxious': (-0.8, 1.0),
-    'depressed': (-1.0, 1.0),   'suicidal': (-1.0, 1.0),
-        'kill': (-1.0, 1.0),        'die': (-1.0, 1.0),
-        'pain': (-0.8, 1.0),        'lonely': (-0.7, 1.0),
-        'overwhelmed': (-0.5, 1.0), 'sad': (-0.7, 1.0),
-        'angry': (-0.5, 1.0),       'horrible': (-0.9, 1.0),
-        'terrible': (-0.9, 1.0),    'hopeless': (-1.0, 1.0),
-        'happy': (0.8, 1.0),        'excited': (0.8, 1.0),
-        'calm': (0.5, 1.0),         'better': (0.5, 1.0),
-        'good': (0.6, 1.0),         'great': (0.8, 1.0),
-        "kill myself": (-1.0, 1.0), "empty": (-0.7, 1.0), "worthless": (-1.0, 1.0),
-        "marne ka mann": (-1.0, 1.0), "marna": (-1.0, 1.0),
-        "jeene ka mann nahi": (-1.0, 1.0), "zindagi se thak": (-0.9, 1.0),
-        "aatmahatya": (-1.0, 1.0), "dukhi": (-0.6, 1.0), "akela": (-0.7, 1.0),
-        "marva nu man": (-1.0, 1.0), "jeevti nathi": (-1.0, 1.0),
-        "dukhi chu": (-0.6, 1.0), "bhay lage chhe": (-0.6, 1.0),
-    "marva nu man": (-1.0, 1.0), 
-}
-
-def AIresponse(user_msg, recent_msgs):
-    system_instruction = (
-        "You are HealChat AI, a compassionate mental health companion. "
-        "Your goal is to provide emotional support, validate feelings, and offer gentle coping techniques. "
-        "GUIDELINES: "
-        "1. Keep responses conversational and short (max 3-4 sentences). "
-        "2. Be empathetic and non-judgmental. Never dismiss the user's pain. "
-        "3. Do NOT provide medical diagnoses or prescribe medication. "
-        "4. If the user expresses self-harm or severe danger, prioritize their safety and suggest professional help immediately."
-    )
+SYSTEM_INSTRUCTION = (
+    "You are HealChat AI, a compassionate mental health companion. "
+    "Your goal is to provide emotional support, validate feelings, and offer gentle coping techniques. "
+    "GUIDELINES: "
+    "1. Keep responses conversational and short (max 3-4 sentences). "
+    "2. Be empathetic and non-judgmental. Never dismiss the user's pain. "
+    "3. Do NOT provide medical diagnoses or prescribe medication. "
+    "4. If the user expresses self-harm or severe danger, prioritize their safety and suggest professional help immediately."
+)
 
-    payload = { "contents": [] }
-    
-    for msg in reversed(recent_msgs):
+FALLBACK_REPLY = "I'm having trouble connecting right now, but I'm here with you. Please try again in a moment."
+
+
+def build_payload(user_msg, context):
+    system_text = SYSTEM_INSTRUCTION
+    if context["summary"]:
+        system_text += f"\n\nSummary of the earlier conversation: {context['summary']}"
+
+    payload = {
+        "system_instruction": {"parts": [{"text": system_text}]},
+        "contents": [],
+    }
+
+    for msg in context["turns"]:
         payload["contents"].append({"role": "user", "parts": [{"text": msg.message}]})
         payload["contents"].append({"role": "model", "parts": [{"text": msg.response}]})
-    
-    final_prompt = f"{system_instruction}\n\nUser says: {user_msg}"
-    payload["contents"].append({"role": "user", "parts": [{"text": final_prompt}]})
 
-    headers = {
-        "X-goog-api-key": settings.API_KEY,
-        "Content-Type": "application/json",
-    }
-    
-    try:
-        response = requests.post(settings.API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        return data["candidates"][0]["content"]["parts"][0]["text"]
-    except Exception as e:
-        print(f"AI Error: {e}")
-        return "I'm having trouble connecting right now, but I'm here with you. Please try again in a moment."
+    payload["contents"].append({"role": "user", "parts": [{"text": user_msg}]})
+    return payload
 
-def compute_scores(messages_list):
-    total_polarity = 0.0
-    count = 0
 
-    for text in messages_list:
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        
-        text_lower = text.lower()
-        for word, (score, subj) in RISK_KEYWORDS.items():
-            if word in text_lower:
-                polarity = score 
-                break 
-        
-        total_polarity += polarity
-        count += 1
+def AIresponse(user_msg, context):
+    payload = build_payload(user_msg, context)
 
-    if count > 0:
-        avg_polarity = total_polarity / count
-    else:
-        avg_polarity = 0.0
+    try:
+        return llm.generate(payload)
+    except Exception as e:
+        print(f"AI Error: {e}")
+        return FALLBACK_REPLY
 
-    mood = int((avg_polarity + 1) * 50) 
-    stress = 100 - mood
-    negative = 100 if avg_polarity < 0 else 0
-    
-    return mood, stress, negative
 
-def analyze_user_data(user):
-    texts = []
-    texts += list(ChatMessage.objects.filter(user=user).order_by('-created_at')[:20].values_list("message", flat=True))
-    texts += list(GroupMessage.objects.filter(sender=user).order_by('-timestamp')[:20].values_list("content", flat=True))
-    texts += list(DirectMessage.objects.filter(sender=user).order_by('-timestamp')[:20].values_list("content", flat=True))
+async def AIresponse_async(user_msg, context):
+    payload = build_payload(user_msg, context)
 
-    texts = [t for t in texts if t.strip()]
-    
-    if len(texts) < 5:
-        return None
-        
-    return texts 
+    try:
+        return await llm.agenerate(payload)
+    except Exception as e:
+        print(f"AI Error: {e}")
+        return FALLBACK_REPLY
 
-def calculate_risk(stress, negative):
-    if stress > 80 or negative > 70: return "High"
-    elif stress > 50 or negative > 40: return "Medium"
-    return "Low"
 
+async def stream_AIresponse(user_msg, context):
+    """
+    Yields reply text chunks as Gemini produces them, using the SSE flavour
+    of the API (streamGenerateContent?alt=sse).
+    """
+    payload = build_payload(user_msg, context)
 
+    async for text in llm.astream(payload):
+        yield text
 
 @login_required
 def chat_page(request):
-    from group.views import sidebar_context
+    from users.views import sidebar_context
     context = sidebar_context(request)
     return render(request, "chatbot/chat.html", context)
 
 @login_required
 def analysis_page(request):
-    from group.views import sidebar_context
+    from users.views import sidebar_context
     context = sidebar_context(request)
     return render(request, "chatbot/analysis.html", context)
 
@@ -137,109 +98,230 @@ class ChatAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user_msgs = ChatMessage.objects.filter(user=request.user).order_by('-created_at')[:50]
-        user_msgs = list(user_msgs)[::-1]
-        serializer = MessageSerializer(user_msgs, many=True)
-        return Response(serializer.data)
+        """
+        History page, newest first: ?before=<cursor> walks back, ?limit= sets
+        the page size. Responds 304 when the client's ETag still matches.
+        """
+        cursor = request.query_params.get('before')
+        limit = parse_limit(request.query_params.get('limit'))
+        user_msgs = ChatMessage.objects.filter(user=request.user)
+
+        # Messages are never edited, so a page only changes when a newer
+        # message arrives (and only the newest page can).
+        if cursor:
+            version = cursor
+        else:
+            version = user_msgs.order_by('-id').values_list('id', flat=True).first() or 0
+        etag = quote_etag(f"chat-{request.user.id}-{version}-{limit}")
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers={"ETag": etag})
+
+        try:
+            rows, next_cursor = keyset_page(user_msgs, 'created_at', cursor, limit)
+        except ValueError:
+            return Response({"error": "Invalid cursor"}, status=400)
+
+        serializer = ChatHistorySerializer(rows, many=True)
+        return Response({"results": serializer.data, "next_cursor": next_cursor}, headers={"ETag": etag})
 
     def post(self, request):
         usr_msg = request.data.get('user_message')
         if not usr_msg:
             return Response({"error": "Empty message"}, status=400)
 
-        blob = TextBlob(usr_msg)
+        turn = prepare_turn(request.user, usr_msg)
 
+        ai_reply = AIresponse(turn["prompt"], turn["context"])
+
+        msg_instance = ChatMessage.objects.create(
+            user=request.user,
+            message=usr_msg,
+            response=ai_reply,
+            emotion=turn["emotion"],
+            polarity=turn["polarity"]
+        )
+        schedule_fold(request.user.id)
         
-        polarity = 0.0
-        
-        lower_msg = usr_msg.lower()
-        custom_hit = False
-        
-        for word, (score, subj) in RISK_KEYWORDS.items():
-            if word in lower_msg:
-                polarity = score 
-                custom_hit = True
-                break 
-        
-        if not custom_hit:
-            polarity = blob.sentiment.polarity
+        return Response({
+            "message": msg_instance.message,
+            "response": msg_instance.response,
+            "emergency_trigger": turn["emergency_trigger"], 
+            "emergency_contact": turn["emergency_contact"] 
+        })
 
- 
-        print(f"User Message: {usr_msg} | Score: {polarity}") 
 
-        emergency_trigger = False
-        emergency_contact = None
-        
-        if polarity < -0.5: 
-            emergency_trigger = True            
-            try:
-                profile = request.user.profile
-                if profile.emergency_name and profile.emergency_phone:
-                    emergency_contact = {
-                        "name": profile.emergency_name,
-                        "phone": profile.emergency_phone
-                    }
-            except Exception as e:
-                print(f"Profile Error: {e}")
+def prepare_turn(user, usr_msg):
+    """
+    Scores the incoming message, works out whether the emergency flow should
+    fire and builds the conversation context the model needs. Shared by the
+    blocking and streaming chat endpoints.
+    """
+    polarity = score_text(usr_msg)
 
-        
-        recent_msgs = ChatMessage.objects.filter(user=request.user).order_by('-created_at')[:3]
-        recent_msgs = list(recent_msgs)[::-1]
-        
-        if emergency_trigger:
-            usr_msg_prompt = f"[CRITICAL: User seems suicidal or very depressed. Suggest seeking help.] User says: {usr_msg}"
-        else:
-            usr_msg_prompt = usr_msg
 
-        ai_reply = AIresponse(usr_msg_prompt, recent_msgs)
+    print(f"User Message: {usr_msg} | Score: {polarity}") 
 
-        msg_instance = ChatMessage.objects.create(
-            user=request.user,
+    emergency_trigger = False
+    emergency_contact = None
+    
+    if polarity < -0.5: 
+        emergency_trigger = True            
+        try:
+            profile = user.profile
+            if profile.emergency_name and profile.emergency_phone:
+                emergency_contact = {
+                    "name": profile.emergency_name,
+                    "phone": profile.emergency_phone
+                }
+        except Exception as e:
+            print(f"Profile Error: {e}")
+
+    
+    context = build_context(user)
+    
+    if emergency_trigger:
+        usr_msg_prompt = f"[CRITICAL: User seems suicidal or very depressed. Suggest seeking help.] User says: {usr_msg}"
+    else:
+        usr_msg_prompt = usr_msg
+
+    return {
+        "prompt": usr_msg_prompt,
+        "context": context,
+        "polarity": polarity,
+        "emotion": "Negative" if polarity < 0 else "Positive",
+        "emergency_trigger": emergency_trigger,
+        "emergency_contact": emergency_contact,
+    }
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def relay_stream(user, usr_msg, turn):
+    # The emergency flag is known before the model is called, so send it
+    # straight away; the client can show the modal while tokens arrive.
+    yield sse_event("meta", {
+        "emergency_trigger": turn["emergency_trigger"],
+        "emergency_contact": turn["emergency_contact"],
+    })
+
+    chunks = []
+    try:
+        async for text in stream_AIresponse(turn["prompt"], turn["context"]):
+            chunks.append(text)
+            yield sse_event("token", {"text": text})
+    except Exception as e:
+        print(f"AI Stream Error: {e}")
+
+    if not chunks:
+        chunks.append(FALLBACK_REPLY)
+        yield sse_event("token", {"text": FALLBACK_REPLY})
+
+    msg_instance = await ChatMessage.objects.acreate(
+        user=user,
+        message=usr_msg,
+        response="".join(chunks),
+        emotion=turn["emotion"],
+        polarity=turn["polarity"]
+    )
+    yield sse_event("done", {"id": msg_instance.id})
+    schedule_fold(user.id)
+
+
+async def read_chat_request(request):
+    """
+    Auth and body parsing for the async chat endpoints, which live outside
+    DRF. Returns (user, message, None) or (None, None, error_response).
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, None, JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None, None, JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    usr_msg = (data.get('user_message') or "").strip()
+    if not usr_msg:
+        return None, None, JsonResponse({"error": "Empty message"}, status=400)
+    return user, usr_msg, None
+
+
+async def chat_stream(request):
+    """
+    Streaming variant of ChatAPIView.post. Relays the reply token by token as
+    Server-Sent Events and stores the full text as one ChatMessage at the end.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    user, usr_msg, error = await read_chat_request(request)
+    if error:
+        return error
+
+    turn = await sync_to_async(prepare_turn)(user, usr_msg)
+
+    response = StreamingHttpResponse(relay_stream(user, usr_msg, turn), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class AsyncChatAPIView(View):
+    """
+    Non-blocking twin of ChatAPIView.post with the same request and response
+    JSON. The upstream call is awaited on the shared pooled client, so a
+    waiting conversation costs a coroutine rather than a worker thread.
+    """
+
+    async def post(self, request):
+        user, usr_msg, error = await read_chat_request(request)
+        if error:
+            return error
+
+        turn = await sync_to_async(prepare_turn)(user, usr_msg)
+
+        ai_reply = await AIresponse_async(turn["prompt"], turn["context"])
+
+        msg_instance = await ChatMessage.objects.acreate(
+            user=user,
             message=usr_msg,
             response=ai_reply,
-            emotion="Negative" if polarity < 0 else "Positive"
+            emotion=turn["emotion"],
+            polarity=turn["polarity"]
         )
-        
-        return Response({
+        schedule_fold(user.id)
+
+        return JsonResponse({
             "message": msg_instance.message,
             "response": msg_instance.response,
-            "emergency_trigger": emergency_trigger, 
-            "emergency_contact": emergency_contact 
+            "emergency_trigger": turn["emergency_trigger"],
+            "emergency_contact": turn["emergency_contact"]
         })
+
     
 class AnalysisAPIView(APIView):
     authentication_classes = [SessionAuthentication, BasicAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        last_report = AnalysisReport.objects.filter(user=request.user).order_by('-timestamp').first()
-        create_new = True
-        if last_report:
-            if (timezone.now() - last_report.timestamp) < timedelta(seconds=45):
-                create_new = False
-
-        if create_new:
-            messages_list = analyze_user_data(request.user) 
-            
-            if messages_list:
-                mood, stress, negative = compute_scores(messages_list)
-                
-                risk = calculate_risk(stress, negative)
-                
-                
-                AnalysisReport.objects.create(
-                    user=request.user,
-                    mood_score=mood,
-                    stress_level=stress,
-                    negative_percentage=negative,
-                    risk_level=risk 
-                )
-        
-        reports_qs = AnalysisReport.objects.filter(user=request.user).order_by('-timestamp')[:20]
-        
+        reports_list = list(AnalysisReport.objects.filter(user=request.user).order_by('-timestamp')[:20])
+
+        if is_stale(reports_list[0] if reports_list else None):
+            enqueue_report(request.user)
         
-        reports_list = list(reports_qs)[::-1] 
+        reports_list = reports_list[::-1] 
         
         serializer = AnalysisReportSerializer(reports_list, many=True)
         return Response(serializer.data)
 
+
+class LLMStatsAPIView(APIView):
+    """Gateway counters (cache hits, breaker trips, latency) for staff."""
+    authentication_classes = [SessionAuthentication, BasicAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(llm.stats())
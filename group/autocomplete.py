@@ -0,0 +1,163 @@
+"""
+Autocomplete for the sidebar search box: users by username, groups by name.
+
+Each process keeps a sorted in-memory list of (lowercase key, id) pairs per
+kind and answers a prefix with two bisects, so a lookup costs O(log n)
+however many users and groups there are. Groups are indexed under every
+word of their name, so "sup" finds "Anxiety Support".
+
+The index is loaded on first use and then kept current by the post_save /
+post_delete receivers in group.signals (create, rename, delete). Changes
+made by other processes are picked up by a full reload every
+AUTOCOMPLETE_RELOAD seconds.
+
+Finished responses (ids resolved to usernames, avatars and slugs, with one
+select_related('profile') query) are cached per prefix for
+AUTOCOMPLETE_CACHE_TTL seconds. The cache key carries the index
+generation, so any change in this process retires stale entries at once.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import Group
+
+User = get_user_model()
+
+RESULTS = 10
+DEFAULT_AVATAR = "/static/avatars/defaults/default1.png"
+
+
+class PrefixIndex:
+    """Sorted (key, id) pairs; an id may sit under several keys."""
+
+    def __init__(self):
+        self._entries = []
+        self._keys = {}  # id -> its keys, to take them out again on rename/delete
+
+    def load(self, items):
+        self._keys = {pk: keys for pk, keys in items}
+        self._entries = sorted((key, pk) for pk, keys in items for key in keys)
+
+    def put(self, pk, keys):
+        """Adds or re-keys `pk`. False if it was already under exactly these keys."""
+        if self._keys.get(pk) == keys:
+            return False
+        self.remove(pk)
+        self._keys[pk] = keys
+        for key in keys:
+            bisect.insort(self._entries, (key, pk))
+        return True
+
+    def remove(self, pk):
+        keys = self._keys.pop(pk, ())
+        for key in keys:
+            i = bisect.bisect_left(self._entries, (key, pk))
+            if i < len(self._entries) and self._entries[i] == (key, pk):
+                del self._entries[i]
+        return bool(keys)
+
+    def lookup(self, prefix, limit):
+        """Ids under keys starting with `prefix`, in key order, without repeats."""
+        found = []
+        i = bisect.bisect_left(self._entries, (prefix,))
+        while i < len(self._entries) and len(found) < limit:
+            key, pk = self._entries[i]
+            if not key.startswith(prefix):
+                break
+            if pk not in found:
+                found.append(pk)
+            i += 1
+        return found
+
+
+def user_keys(username):
+    return (username.lower(),)
+
+
+def group_keys(name):
+    words = name.lower().split()
+    return tuple(" ".join(words[i:]) for i in range(len(words)))
+
+
+class Autocomplete:
+    def __init__(self, reload_after):
+        self.reload_after = reload_after
+        self.users = PrefixIndex()
+        self.groups = PrefixIndex()
+        self.generation = 0
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.reload_after:
+            return
+        users = [(pk, user_keys(name)) for pk, name in User.objects.values_list("id", "username")]
+        groups = [(pk, group_keys(name)) for pk, name in Group.objects.values_list("id", "name")]
+        with self._lock:
+            self.users.load(users)
+            self.groups.load(groups)
+            self.generation += 1
+            self._loaded_at = time.monotonic()
+
+    def user_saved(self, user):
+        with self._lock:
+            if self.users.put(user.pk, user_keys(user.username)):
+                self.generation += 1
+
+    def user_deleted(self, user):
+        with self._lock:
+            if self.users.remove(user.pk):
+                self.generation += 1
+
+    def group_saved(self, group):
+        with self._lock:
+            if self.groups.put(group.pk, group_keys(group.name)):
+                self.generation += 1
+
+    def group_deleted(self, group):
+        with self._lock:
+            if self.groups.remove(group.pk):
+                self.generation += 1
+
+    def search(self, q):
+        """{"users": [...], "groups": [...]} for prefix `q`, cached briefly."""
+        prefix = " ".join(q.lower().split())
+        if not prefix:
+            return {"users": [], "groups": []}
+        self._ensure_loaded()
+        key = f"autocomplete:{self.generation}:{prefix}"
+        result = cache.get(key)
+        if result is None:
+            result = self._resolve(prefix)
+            cache.set(key, result, settings.AUTOCOMPLETE_CACHE_TTL)
+        return result
+
+    def _resolve(self, prefix):
+        with self._lock:
+            # One extra user so the caller can drop themselves and still show RESULTS.
+            user_ids = self.users.lookup(prefix, RESULTS + 1)
+            group_ids = self.groups.lookup(prefix, RESULTS)
+
+        users = User.objects.select_related("profile").in_bulk(user_ids)
+        groups = Group.objects.only("name", "slug").in_bulk(group_ids)
+        user_rows = []
+        for pk in user_ids:
+            u = users.get(pk)
+            if u is None:
+                continue
+            profile = getattr(u, "profile", None)
+            user_rows.append({
+                "id": u.pk,
+                "username": u.username,
+                "avatar": profile.get_avatar_url() if profile else DEFAULT_AVATAR,
+            })
+        group_rows = [{"name": groups[pk].name, "slug": groups[pk].slug} for pk in group_ids if pk in groups]
+        return {"users": user_rows, "groups": group_rows}
+
+
+autocomplete = Autocomplete(settings.AUTOCOMPLETE_RELOAD)
@@ -0,0 +1,225 @@
+"""
+Bounded outbound queues for WebSocket consumers.
+
+Without this, a handler awaits the client's send before the consumer takes
+its next channel-layer message. A client on a slow link then backs work up
+into the layer, which buffers for it until capacity and then drops messages
+silently, for that client and for everyone sharing the layer's buffers.
+
+BoundedSendMixin puts a per-connection queue of at most WS_SEND_QUEUE_SIZE
+frames between the handlers and the socket, drained by one writer task, so
+handlers return at once and the layer keeps flowing. When the queue is full,
+WS_SEND_QUEUE_POLICY (or the consumer's send_queue_policy) decides:
+
+- "drop_oldest": the oldest queued frame is discarded.
+- "coalesce": frames sent with a coalesce_key (presence updates, read
+  receipts, notification counts) replace the queued frame with the same
+  key, whether or not the queue is full; otherwise as drop_oldest.
+- "disconnect": the socket is closed with CLOSE_SLOW_CONSUMER (4008). The
+  client reconnects and catches up from the history endpoints.
+
+How full the queues get depends on the server: Daphne accepts sends into
+its transport's write buffer without waiting, so the queue alone would let
+a slow client grow that buffer without bound. The writer therefore checks
+the transport's backlog (see transport_backlog) before every frame and
+closes with CLOSE_SLOW_CONSUMER once it passes WS_TRANSPORT_BUFFER_MAX
+bytes, whatever the policy. Servers that wait for the socket to drain push
+backpressure into the queue instead.
+
+Closing goes through the queue too: close() writes out what is already
+queued, then the close frame, and anything sent after that is dropped.
+
+stats() reports live queue depth and counters for the staff endpoint.
+"""
+import asyncio
+import threading
+import weakref
+from collections import deque
+from functools import partial
+
+from django.conf import settings
+
+CLOSE_SLOW_CONSUMER = 4008
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class Stats:
+    COUNTERS = ("frames_sent", "frames_dropped", "frames_coalesced", "slow_disconnects")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.COUNTERS, 0)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+_stats = Stats()
+_connections = weakref.WeakSet()
+
+
+def transport_backlog(send):
+    """
+    Bytes the server has taken for this socket but not yet written to the
+    network, or None when that cannot be seen from `send` (the consumer's
+    base_send). Understands Daphne, whose send is
+    partial(server.handle_reply, protocol) over a Twisted transport, and
+    servers whose send is a method of a protocol with an asyncio transport,
+    seen through channels' session middleware wrapper.
+    """
+    owner = None
+    while send is not None:
+        if isinstance(send, partial):
+            owner = send.args[0] if send.args else None
+            break
+        owner = getattr(send, "__self__", None)
+        send = getattr(owner, "real_send", None)
+    transport = getattr(owner, "transport", None)
+    backlog = 0
+    while transport is not None:
+        if hasattr(transport, "get_write_buffer_size"):
+            return backlog + transport.get_write_buffer_size()
+        if hasattr(transport, "dataBuffer"):
+            # twisted.internet.abstract.FileDescriptor
+            return backlog + len(transport.dataBuffer) - transport.offset + transport._tempDataLen
+        # A TLS layer holds application data back until its handshake is done.
+        backlog += sum(len(chunk) for chunk in getattr(transport, "_appSendBuffer", ()))
+        transport = getattr(transport, "transport", None)
+    return None
+
+
+def stats():
+    data = _stats.snapshot()
+    depths = [c.send_queue_depth() for c in list(_connections)]
+    data.update({
+        "connections": len(depths),
+        "queued_frames": sum(depths),
+        "max_queue_depth": max(depths, default=0),
+        "queue_size": settings.WS_SEND_QUEUE_SIZE,
+        "transport_buffer_max": settings.WS_TRANSPORT_BUFFER_MAX,
+        "policy": settings.WS_SEND_QUEUE_POLICY,
+    })
+    return data
+
+
+class BoundedSendMixin:
+    """Mix into an AsyncWebsocketConsumer ahead of it: class C(BoundedSendMixin, AsyncWebsocketConsumer)."""
+    send_queue_policy = None    # None: settings.WS_SEND_QUEUE_POLICY
+    send_queue_size = None      # None: settings.WS_SEND_QUEUE_SIZE
+
+    _send_queue = None
+
+    def _init_send_queue(self):
+        self._send_queue = deque()
+        self._send_keyed = {}
+        self._send_ready = asyncio.Event()
+        self._send_closed = False
+        self._send_policy = self.send_queue_policy or settings.WS_SEND_QUEUE_POLICY
+        self._send_limit = self.send_queue_size or settings.WS_SEND_QUEUE_SIZE
+        if self._send_policy not in POLICIES:
+            raise ValueError(f"Unknown send queue policy {self._send_policy!r}; expected one of {POLICIES}")
+        self._send_writer = None
+        _connections.add(self)
+
+    def send_queue_depth(self):
+        return len(self._send_queue) if self._send_queue is not None else 0
+
+    async def send(self, text_data=None, bytes_data=None, close=False, coalesce_key=None):
+        if self._send_queue is None:
+            self._init_send_queue()
+        if self._send_closed:
+            return
+        if close:
+            if text_data is not None or bytes_data is not None:
+                self._send_queue.append([None, text_data, bytes_data])
+            await self.close(close)
+            return
+
+        if coalesce_key is not None and self._send_policy == "coalesce":
+            queued = self._send_keyed.get(coalesce_key)
+            if queued is not None:
+                queued[1], queued[2] = text_data, bytes_data
+                _stats.incr("frames_coalesced")
+                return
+
+        if len(self._send_queue) >= self._send_limit:
+            if self._send_policy == "disconnect":
+                if self._send_writer is not None:
+                    self._send_writer.cancel()
+                await self._disconnect_slow(1)
+                return
+            self._forget(self._send_queue.popleft())
+            _stats.incr("frames_dropped")
+
+        frame = [coalesce_key, text_data, bytes_data]
+        self._send_queue.append(frame)
+        if coalesce_key is not None:
+            self._send_keyed[coalesce_key] = frame
+        self._send_ready.set()
+        if self._send_writer is None:
+            self._send_writer = asyncio.create_task(self._drain_send_queue())
+
+    async def close(self, code=None, reason=None):
+        # Frames already queued go out first; nothing follows the close frame.
+        if self._send_queue is not None and not self._send_closed:
+            self._send_closed = True
+            writer = self._send_writer
+            if writer is not None and not writer.done():
+                # Wake it so it drains what is queued and stops.
+                self._send_ready.set()
+                await asyncio.gather(writer, return_exceptions=True)
+            while self._send_queue:
+                frame = self._send_queue.popleft()
+                await super().send(text_data=frame[1], bytes_data=frame[2])
+                _stats.incr("frames_sent")
+            self._send_keyed.clear()
+        await super().close(code, reason)
+
+    async def _disconnect_slow(self, dropped=0):
+        _stats.incr("slow_disconnects")
+        _stats.incr("frames_dropped", len(self._send_queue) + dropped)
+        self._send_closed = True
+        self._send_queue.clear()
+        self._send_keyed.clear()
+        await super().close(code=CLOSE_SLOW_CONSUMER)
+
+    def _transport_full(self):
+        backlog = transport_backlog(self.base_send)
+        return backlog is not None and backlog > settings.WS_TRANSPORT_BUFFER_MAX
+
+    def _forget(self, frame):
+        if frame[0] is not None and self._send_keyed.get(frame[0]) is frame:
+            del self._send_keyed[frame[0]]
+
+    async def _drain_send_queue(self):
+        try:
+            while True:
+                await self._send_ready.wait()
+                self._send_ready.clear()
+                while self._send_queue:
+                    if self._transport_full():
+                        await self._disconnect_slow()
+                        return
+                    frame = self._send_queue.popleft()
+                    self._forget(frame)
+                    await super().send(text_data=frame[1], bytes_data=frame[2])
+                    _stats.incr("frames_sent")
+                if self._send_closed:
+                    return
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"WebSocket writer error: {e}")
+
+    async def websocket_disconnect(self, message):
+        if self._send_queue is not None:
+            self._send_closed = True
+            if self._send_writer is not None:
+                self._send_writer.cancel()
+            _connections.discard(self)
+        await super().websocket_disconnect(message)
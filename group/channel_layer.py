@@ -0,0 +1,467 @@
+"""
+Channel layer for several ASGI worker processes on one host, without Redis.
+
+A small broker process (`manage.py run_channel_broker`) owns every channel
+queue and group; each worker process talks to it over a Unix-domain socket
+through UnixSocketChannelLayer:
+
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "group.channel_layer.UnixSocketChannelLayer",
+            "CONFIG": {"path": "/tmp/healchat-channels.sock"},
+        },
+    }
+
+Semantics follow InMemoryChannelLayer: per-channel capacity (ChannelFull on
+send, silently skipped on group_send), message expiry (an expired message
+also drops its channel from all groups), group membership expiry, and the
+"groups" and "flush" extensions. The broker reads expiry/group_expiry/
+capacity/channel_capacity from the same CONFIG, so both sides agree.
+group_size() reports how many channels a group holds across all workers,
+which presence uses to tell whether a user still has a socket elsewhere.
+
+Wire format: every frame is `!II` (header length, body length) followed by a
+JSON header and an optional body. Messages travel as the body, encoded once
+by the sender; the broker never decodes them, so a group_send to N channels
+forwards the same bytes N times. Message values must be JSON-serializable;
+bytes are carried base64-encoded and come back as bytes, tuples come back as
+lists.
+
+Groups and queued messages live only in the broker, so restarting it drops
+them (connected consumers re-join on their next connect, as with Redis
+flushes).
+"""
+import asyncio
+import base64
+import itertools
+import json
+import os
+import random
+import socket
+import string
+import struct
+import time
+import uuid
+import weakref
+from collections import deque
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+FRAME_HEADER = struct.Struct("!II")
+
+
+# ------------------------------------------------------------------ wire
+
+def _encode_default(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(obj).decode()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not channel-layer serializable")
+
+
+def _decode_hook(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def encode_message(message):
+    return json.dumps(message, default=_encode_default, separators=(",", ":")).encode()
+
+
+def decode_message(body):
+    return json.loads(body, object_hook=_decode_hook)
+
+
+def frame(header, body=b""):
+    head = json.dumps(header, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(len(head), len(body)) + head + body
+
+
+async def read_frame(reader):
+    head_len, body_len = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    header = json.loads(await reader.readexactly(head_len))
+    body = await reader.readexactly(body_len) if body_len else b""
+    return header, body
+
+
+# ---------------------------------------------------------------- broker
+
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.prefix = None
+        self.parked = {}        # request id -> channel, for pending receives
+        self.closed = False
+
+    def reply(self, header, body=b""):
+        if not self.closed:
+            self.writer.write(frame(header, body))
+
+
+class Broker:
+    """Owns the queues and groups; one instance per host, run by run_channel_broker."""
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+        self.path = path
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        # Reuse the layer's capacity pattern matching.
+        self._limits = BaseChannelLayer(capacity=capacity, channel_capacity=channel_capacity)
+        self._limits.channel_capacity = self._limits.compile_capacities(self._limits.channel_capacity)
+        self.queues = {}        # channel -> deque of (expires_at, body)
+        self.waiters = {}       # channel -> deque of (client, request id)
+        self.groups = {}        # group -> {channel: joined_at}
+        self.prefixes = {}      # client prefix -> connected client count
+
+    async def serve(self):
+        self._remove_stale_socket()
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        sweeper = asyncio.create_task(self._sweep_forever())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+        else:
+            raise RuntimeError(f"a channel broker is already listening on {self.path}")
+        finally:
+            probe.close()
+
+    async def _handle(self, reader, writer):
+        client = _Client(writer)
+        try:
+            while True:
+                header, body = await read_frame(reader)
+                self._dispatch(client, header, body)
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._drop_client(client)
+            writer.close()
+
+    def _dispatch(self, client, header, body):
+        op = header["op"]
+        rid = header.get("id")
+        if op == "group_send":
+            for channel in list(self.groups.get(header["group"], ())):
+                self._deliver(channel, body)
+        elif op == "send":
+            ok = self._deliver(header["channel"], body)
+            client.reply({"id": rid} if ok else {"id": rid, "error": "full"})
+        elif op == "receive":
+            self._receive(client, rid, header["channel"])
+        elif op == "cancel":
+            # Either this ack or the message itself answers the cancelled
+            # receive, never both.
+            cancelled = header["rid"]
+            channel = client.parked.pop(cancelled, None)
+            if channel is not None:
+                waiting = self.waiters[channel]
+                waiting.remove((client, cancelled))
+                if not waiting:
+                    del self.waiters[channel]
+                client.reply({"id": cancelled})
+        elif op == "requeue":
+            self._deliver(header["channel"], body, front=True)
+        elif op == "group_add":
+            self.groups.setdefault(header["group"], {})[header["channel"]] = time.time()
+            client.reply({"id": rid})
+        elif op == "group_discard":
+            members = self.groups.get(header["group"])
+            if members:
+                members.pop(header["channel"], None)
+                if not members:
+                    del self.groups[header["group"]]
+            client.reply({"id": rid})
+        elif op == "group_size":
+            client.reply({"id": rid}, str(len(self.groups.get(header["group"], ()))).encode())
+        elif op == "flush":
+            self.queues.clear()
+            self.groups.clear()
+            client.reply({"id": rid})
+        elif op == "hello":
+            client.prefix = header["prefix"]
+            self.prefixes[client.prefix] = self.prefixes.get(client.prefix, 0) + 1
+            client.reply({"id": rid})
+
+    def _deliver(self, channel, body, front=False):
+        waiting = self.waiters.get(channel)
+        while waiting:
+            client, rid = waiting.popleft()
+            if not waiting:
+                del self.waiters[channel]
+            if client.parked.pop(rid, None) is not None and not client.closed:
+                client.reply({"id": rid}, body)
+                return True
+            waiting = self.waiters.get(channel)
+
+        queue = self.queues.get(channel)
+        if queue is None:
+            queue = self.queues[channel] = deque()
+        if front:
+            queue.appendleft((time.time() + self.expiry, body))
+            return True
+        if len(queue) >= self._limits.get_capacity(channel):
+            return False
+        queue.append((time.time() + self.expiry, body))
+        return True
+
+    def _receive(self, client, rid, channel):
+        queue = self.queues.get(channel)
+        now = time.time()
+        while queue:
+            expires, body = queue.popleft()
+            if not queue:
+                del self.queues[channel]
+            if expires >= now:
+                client.reply({"id": rid}, body)
+                return
+            self._remove_from_groups(channel)
+            queue = self.queues.get(channel)
+        client.parked[rid] = channel
+        self.waiters.setdefault(channel, deque()).append((client, rid))
+
+    def _remove_from_groups(self, channel):
+        for group, members in list(self.groups.items()):
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+
+    def _drop_client(self, client):
+        client.closed = True
+        for rid, channel in client.parked.items():
+            waiting = self.waiters.get(channel)
+            if waiting:
+                waiting.remove((client, rid))
+                if not waiting:
+                    del self.waiters[channel]
+        client.parked.clear()
+
+        # Once the last connection of a worker process is gone its channels
+        # can never be received from again.
+        if client.prefix is None:
+            return
+        self.prefixes[client.prefix] -= 1
+        if self.prefixes[client.prefix]:
+            return
+        del self.prefixes[client.prefix]
+        marker = f".{client.prefix}!"
+        for channel in [c for c in self.queues if marker in c]:
+            del self.queues[channel]
+        for group, members in list(self.groups.items()):
+            for channel in [c for c in members if marker in c]:
+                del members[channel]
+            if not members:
+                del self.groups[group]
+
+    def sweep(self):
+        now = time.time()
+        for channel, queue in list(self.queues.items()):
+            expired = False
+            while queue and queue[0][0] < now:
+                queue.popleft()
+                expired = True
+            if expired:
+                self._remove_from_groups(channel)
+            if not queue:
+                del self.queues[channel]
+
+        joined_before = now - self.group_expiry
+        for group, members in list(self.groups.items()):
+            for channel, joined in list(members.items()):
+                if joined < joined_before:
+                    del members[channel]
+            if not members:
+                del self.groups[group]
+
+    async def _sweep_forever(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+
+# ---------------------------------------------------------------- client
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.abandoned = {}     # cancelled receive id -> channel
+        self.ids = itertools.count(1)
+        self.alive = True
+        self.task = asyncio.create_task(self._read_forever())
+
+    async def _read_forever(self):
+        error = ConnectionError("channel broker connection lost")
+        try:
+            while True:
+                header, body = await read_frame(self.reader)
+                future = self.pending.pop(header["id"], None)
+                if future is None:
+                    # A receive that was cancelled after the broker had
+                    # already handed it a message: put the message back.
+                    channel = self.abandoned.pop(header["id"], None)
+                    if channel is not None and body:
+                        self.post({"op": "requeue", "channel": channel}, body)
+                    continue
+                if future.done():
+                    continue
+                if header.get("error"):
+                    future.set_exception(ChannelFull())
+                else:
+                    future.set_result(body)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"channel broker connection lost: {e}")
+        finally:
+            self.alive = False
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    def post(self, header, body=b""):
+        """Fire-and-forget request (no reply expected)."""
+        if not self.alive:
+            raise ConnectionError("channel broker connection lost")
+        self.writer.write(frame(header, body))
+
+    async def request(self, header, body=b""):
+        rid = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[rid] = future
+        header["id"] = rid
+        self.post(header, body)
+        if self.writer.transport.get_write_buffer_size() > 1 << 16:
+            await self.writer.drain()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # A consumer shutting down cancels its receive(); tell the broker
+            # so it stops holding messages for this request.
+            self.pending.pop(rid, None)
+            if self.alive and header["op"] == "receive":
+                self.abandoned[rid] = header["channel"]
+                self.post({"op": "cancel", "rid": rid})
+            raise
+
+    def close(self):
+        self.alive = False
+        self.task.cancel()
+        self.writer.close()
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """Client side of the broker; see the module docstring for configuration."""
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, path="/tmp/healchat-channels.sock", expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.path = path
+        self.group_expiry = group_expiry
+        self.client_prefix = uuid.uuid4().hex[:12]
+        # One connection per event loop, like the LLM gateway's clients.
+        self._connections = weakref.WeakKeyDictionary()
+        self._connect_locks = weakref.WeakKeyDictionary()
+
+    async def _connection(self):
+        loop = asyncio.get_running_loop()
+        conn = self._connections.get(loop)
+        if conn is not None and conn.alive:
+            return conn
+        lock = self._connect_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            conn = self._connections.get(loop)
+            if conn is None or not conn.alive:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                conn = _Connection(reader, writer)
+                await conn.request({"op": "hello", "prefix": self.client_prefix})
+                self._connections[loop] = conn
+        return conn
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        conn = await self._connection()
+        await conn.request({"op": "send", "channel": channel}, encode_message(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        conn = await self._connection()
+        body = await conn.request({"op": "receive", "channel": channel})
+        return decode_message(body)
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.%s!%s" % (
+            prefix,
+            self.client_prefix,
+            "".join(random.choice(string.ascii_letters) for i in range(12)),
+        )
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        conn = await self._connection()
+        await conn.request({"op": "group_add", "group": group, "channel": channel})
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        conn = await self._connection()
+        await conn.request({"op": "group_discard", "group": group, "channel": channel})
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        conn = await self._connection()
+        # Full channels are skipped, as in the other layers, so there is
+        # nothing to wait for.
+        conn.post({"op": "group_send", "group": group}, encode_message(message))
+        if conn.writer.transport.get_write_buffer_size() > 1 << 16:
+            await conn.writer.drain()
+
+    async def group_size(self, group):
+        self.require_valid_group_name(group)
+        conn = await self._connection()
+        return int(await conn.request({"op": "group_size", "group": group}))
+
+    async def flush(self):
+        conn = await self._connection()
+        await conn.request({"op": "flush"})
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        conn = self._connections.pop(loop, None)
+        if conn is not None:
+            conn.close()
+
+
+async def group_size(layer, group):
+    """
+    Channels in `group` across every worker, or None when `layer` cannot
+    tell (layers other than this one and InMemoryChannelLayer).
+    """
+    if isinstance(layer, UnixSocketChannelLayer):
+        return await layer.group_size(group)
+    groups = getattr(layer, "groups", None)
+    if isinstance(groups, dict):
+        # InMemoryChannelLayer: one process holds every channel.
+        return len(groups.get(group, ()))
+    return None
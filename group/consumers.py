@@ -2,81 +2,152 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.contrib.auth import get_user_model
 from channels.db import database_sync_to_async
-from .models import Group, GroupMessage, DirectMessage
-from django.utils import timezone
+from django.db import transaction
+from .models import Group, GroupMessage, GroupReadCursor, DirectMessage, Conversation, ConversationParticipant, Notification, conversation_key
+from chatbot.sentiment import score_text
+from django.conf import settings
+from . import write_behind
+from .backpressure import BoundedSendMixin
+from .channel_layer import group_size
+from .framing import CompactFramingMixin
+from users.presence import presence, status_group
+from users import sidebar
 
 User = get_user_model()
 
-class GroupChatConsumer(AsyncWebsocketConsumer):
+# Close code sent to sockets whose group membership was revoked.
+CLOSE_MEMBERSHIP_REVOKED = 4003
+
+
+def membership_channel_group(group_id, user_id):
+    """Channel-layer group holding one user's open sockets for one chat group."""
+    return f"groupmember_{group_id}_{user_id}"
+
+
+def direct_room_name(username_a, username_b):
+    """Channel-layer group of both users' sockets for their DM."""
+    users = sorted([username_a, username_b])
+    return f"direct_{users[0]}_{users[1]}"
+
+
+def read_upto(data):
+    """The message id of a client's {"type": "read", "message_id": n} frame, or None."""
+    message_id = data.get("message_id")
+    if type(message_id) is int and message_id > 0:
+        return message_id
+    return None
+
+
+def receipt_event(user, message_id):
+    """Channel-layer event carrying a read_receipt frame for `user`."""
+    return {
+        "type": "read.receipt",
+        "user_id": user.id,
+        "frame": json.dumps({
+            "type": "read_receipt",
+            "user_id": user.id,
+            "username": user.username,
+            "message_id": message_id,
+        }),
+    }
+
+
+class GroupChatConsumer(CompactFramingMixin, BoundedSendMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.slug = self.scope["url_route"]["kwargs"]["slug"]
         self.group_name = f"group_{self.slug}"
+        self.group = None
         user = self.scope["user"]
         
         if not user.is_authenticated:
             await self.close()
             return
 
-        is_member = await database_sync_to_async(self._is_member)()
-        if not is_member:
+        # Resolved once; membership changes reach the socket as a
+        # member.revoked event instead of being re-checked per message.
+        self.group = await database_sync_to_async(self._member_group)()
+        if self.group is None:
             await self.close()
             return
 
+        self.member_group_name = membership_channel_group(self.group.id, user.id)
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        await self.channel_layer.group_add(self.member_group_name, self.channel_name)
+        await self.accept_negotiated()
 
-    def _is_member(self):
-        try:
-            g = Group.objects.get(slug=self.slug)
-            return g.members.filter(id=self.scope["user"].id).exists()
-        except Group.DoesNotExist:
-            return False
+    def _member_group(self):
+        return Group.objects.filter(slug=self.slug, members=self.scope["user"]).first()
 
     async def disconnect(self, close_code):
+        if self.group is None:
+            return
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await self.channel_layer.group_discard(self.member_group_name, self.channel_name)
+
+    async def member_revoked(self, event):
+        await self.close(code=CLOSE_MEMBERSHIP_REVOKED)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         user = self.scope["user"]
-        data = json.loads(text_data)
+        data = self.decode(text_data, bytes_data)
+        if data is None:
+            return
+        if data.get("type") == "read":
+            await self._mark_read(user, read_upto(data))
+            return
+
         content = data.get("message", "").strip()
         is_anon = data.get("is_anonymous", False)
-        print(is_anon)
+        client_msg_id = data.get("client_msg_id")
+        if not isinstance(client_msg_id, str) or len(client_msg_id) > 64:
+            client_msg_id = None
 
         if not content:
             return
-        msg = await database_sync_to_async(self._save_message)(user, content, is_anon)
+        if settings.GROUP_WRITE_BEHIND:
+            msg = await write_behind.submit(self.group, user, content, is_anon)
+        else:
+            msg = await database_sync_to_async(self._save_message)(user, content, is_anon)
 
         sender_name = "Anonymous" if is_anon else user.username
-        
-        payload = {
-            "type": "chat.message",
+
+        # One frame for every member, encoded here once. Clients work out
+        # is_me themselves: from sender_id, or for anonymous messages (which
+        # must not reveal the sender) from the client_msg_id they sent.
+        frame = json.dumps({
             "id": msg.id,
-            "sender": sender_name, 
-            "sender_id": user.id, 
+            "sender": sender_name,
+            "sender_id": None if is_anon else user.id,
+            "client_msg_id": client_msg_id,
             "message": content,
             "timestamp": msg.timestamp.isoformat(),
-            "is_anonymous": is_anon 
-        }
-       
-        await self.channel_layer.group_send(self.group_name, payload)
+            "is_anonymous": is_anon
+        })
+
+        await self.channel_layer.group_send(self.group_name, {"type": "chat.message", "frame": frame})
 
     def _save_message(self, user, content, is_anon):
-        g = Group.objects.get(slug=self.slug)
-        return GroupMessage.objects.create(group=g, sender=user, content=content, is_anonymous=is_anon)
+        return GroupMessage.objects.create(group=self.group, sender=user, content=content, is_anonymous=is_anon,
+                                           polarity=score_text(content))
 
     async def chat_message(self, event):
-        is_me = (event["sender_id"] == self.scope["user"].id)
+        await self.send_frame(event["frame"])
 
-        await self.send(text_data=json.dumps({
-            "id": event["id"],
-            "sender": event["sender"], 
-            "message": event["message"],
-            "timestamp": event["timestamp"],
-            "is_anonymous": event["is_anonymous"],
-            "is_me": is_me  
-        }))
+    async def _mark_read(self, user, message_id):
+        # Receipts only go out when the cursor actually moves.
+        if message_id is None:
+            return
+        moved = await database_sync_to_async(GroupReadCursor.mark_read)(self.group.id, user.id, message_id)
+        if moved:
+            await database_sync_to_async(sidebar.invalidate_unread)(user.id)
+            await self.channel_layer.group_send(self.group_name, receipt_event(user, message_id))
 
-class DirectChatConsumer(AsyncWebsocketConsumer):
+    async def read_receipt(self, event):
+        # Only a reader's latest receipt matters.
+        await self.send_frame(event["frame"], coalesce_key=("read", event["user_id"]))
+
+
+class DirectChatConsumer(CompactFramingMixin, BoundedSendMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.other_username = self.scope["url_route"]["kwargs"]["username"]
         self.user = self.scope["user"]
@@ -89,26 +160,24 @@ class DirectChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        users = sorted([self.user.username, self.other_username])
-        self.room_name = f"direct_{users[0]}_{users[1]}"
+        self.room_name = direct_room_name(self.user.username, self.other_username)
+        self.status_group = status_group(other.id)
+        self.conversation_key = conversation_key(self.user.id, other.id)
+        self.other_id = other.id
 
         await self.channel_layer.group_add(self.room_name, self.channel_name)
-        await self.accept()
+        await self.channel_layer.group_add(self.status_group, self.channel_name)
+        await self.accept_negotiated()
+
+        online = await database_sync_to_async(presence.online_ids)([other.id])
+        await self.user_status({"user_id": other.id, "status": "online" if online else "offline"})
 
-        await self.channel_layer.group_send(
-            self.room_name,
-            {
-                "type": "user_status",
-                "user_id": self.user.id,
-                "status": "online"
-            }
-        )
     async def user_status(self, event):
-            await self.send(text_data=json.dumps({
+            await self.send_payload({
                 "type": "status_update",
                 "user_id": event["user_id"],
                 "status": event["status"]
-            }))
+            }, coalesce_key=("status", event["user_id"]))
 
     def _get_user(self, username):
         try:
@@ -117,11 +186,22 @@ class DirectChatConsumer(AsyncWebsocketConsumer):
             return None
 
     async def disconnect(self, close_code):
+        if not hasattr(self, "room_name"):
+            return
         await self.channel_layer.group_discard(self.room_name, self.channel_name)
+        await self.channel_layer.group_discard(self.status_group, self.channel_name)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         user = self.user
-        data = json.loads(text_data)
+        data = self.decode(text_data, bytes_data)
+        if data is None:
+            return
+        if data.get("type") == "read":
+            message_id = read_upto(data)
+            if message_id and await database_sync_to_async(self._mark_read)(message_id):
+                await self.channel_layer.group_send(self.room_name, receipt_event(user, message_id))
+            return
+
         content = data.get("message", "").strip()
         is_anon = data.get("is_anonymous", False) 
 
@@ -132,7 +212,7 @@ class DirectChatConsumer(AsyncWebsocketConsumer):
         if not receiver:
             return
         
-        msg = await database_sync_to_async(self._save_direct)(user, receiver, content)
+        msg, notification = await database_sync_to_async(self._save_direct)(user, receiver, content)
 
         await self.channel_layer.group_send(
             self.room_name,
@@ -146,30 +226,46 @@ class DirectChatConsumer(AsyncWebsocketConsumer):
             }
         )
 
+        # The entry is already stored; this only reaches pages open right now.
+        # Coalesced entries keep their id, so the page updates that toast.
         await self.channel_layer.group_send(
             f"user_{receiver.id}",
-            {
-                "type": "send_notification",
-                "sender": user.username,
-                "message": content[:30] + "..." if len(content) > 30 else content,
-                "link": f"/groups/chat/{user.username}/"
-            }
+            {"type": "send_notification", "notification": notification.as_frame(user.username)}
         )
 
     def _save_direct(self, sender, receiver, content):
-        return DirectMessage.objects.create(sender=sender, receiver=receiver, content=content)
+        polarity = score_text(content)
+        preview = content[:30] + "..." if len(content) > 30 else content
+        with transaction.atomic():
+            msg = DirectMessage.objects.create(sender=sender, receiver=receiver, content=content,
+                                               polarity=polarity)
+            Conversation.record(msg)
+            notification = Notification.push(receiver.id, sender.id, preview, f"/groups/chat/{sender.username}/")
+        return msg, notification
+
+    def _mark_read(self, message_id):
+        moved = ConversationParticipant.mark_read(self.conversation_key, self.user.id, message_id)
+        if moved:
+            sidebar.invalidate(self.user.id)
+            # What the toasts announced has now been read in the chat itself.
+            Notification.mark_read(self.user.id, sender_id=self.other_id)
+        return moved
+
+    async def read_receipt(self, event):
+        # Only a reader's latest receipt matters.
+        await self.send_frame(event["frame"], coalesce_key=("read", event["user_id"]))
 
     async def direct_message(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             "id": event["id"],
             "sender": event["sender"],
             "receiver": event["receiver"],
             "message": event["message"],
             "timestamp": event["timestamp"]
-        }))
+        })
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(CompactFramingMixin, BoundedSendMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         if not self.user.is_authenticated:
@@ -178,22 +274,58 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
         self.group_name = f"user_{self.user.id}"
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
-        await self.update_user_status()
+        await self.accept_negotiated()
+        # Every page holds one of these sockets, so they drive presence.
+        if presence.connect(self.user.id):
+            await self.broadcast_status("online")
+
+        # Whatever arrived while no page was open, in one frame.
+        pending = await database_sync_to_async(self._pending)()
+        if pending:
+            await self.send_payload({"type": "notifications", "items": pending})
+
+    def _pending(self):
+        unread = (
+            Notification.objects.filter(recipient=self.user, is_read=False, is_delivered=False)
+            .select_related("sender").order_by("-updated_at")[:settings.NOTIFICATION_REPLAY_LIMIT]
+        )
+        frames = [n.as_frame(n.sender.username) for n in unread]
+        Notification.mark_delivered(frames)
+        return frames
 
     async def disconnect(self, close_code):
+        if not self.user.is_authenticated:
+            return
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    @database_sync_to_async
-    def update_user_status(self):
-        if self.user.is_authenticated:
-            self.user.profile.last_seen = timezone.now()
-            self.user.profile.save(update_fields=['last_seen'])
+        # Presence is per process; the user's group in the channel layer
+        # also holds their sockets in other workers.
+        if presence.disconnect(self.user.id) and not await group_size(self.channel_layer, self.group_name):
+            await self.broadcast_status("offline")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Pages send a periodic heartbeat, and mark notifications read when
+        # they are dismissed or followed.
+        presence.touch(self.user.id)
+        data = self.decode(text_data, bytes_data)
+        if data is not None and data.get("type") == "notifications_read":
+            ids = data.get("ids")
+            if ids == "all":
+                ids = None
+            elif not isinstance(ids, list) or not all(type(i) is int for i in ids):
+                return
+            await database_sync_to_async(Notification.mark_read)(self.user.id, ids)
+
+    async def broadcast_status(self, status):
+        await self.channel_layer.group_send(
+            status_group(self.user.id),
+            {"type": "user_status", "user_id": self.user.id, "status": status}
+        )
 
     async def send_notification(self, event):
-        await self.send(text_data=json.dumps({
-            "sender": event["sender"],
-            "message": event["message"],
-            "link": event["link"]
-        }))
+        # A coalesced notification supersedes its earlier frame.
+        notification = event["notification"]
+        await self.send_payload({"type": "notification", **notification},
+                                coalesce_key=("notification", notification["id"]))
+        # Shown live, so there is nothing to replay on the next page load.
+        await database_sync_to_async(Notification.mark_delivered)([notification])
 
@@ -0,0 +1,144 @@
+"""
+Compact WebSocket framing, negotiated per connection.
+
+JSON text frames stay the default. A client that lists SUBPROTOCOL in its
+Sec-WebSocket-Protocol header gets binary frames instead: the same payloads as MessagePack, with the short
+keys in SHORT_KEYS and timestamps as integer epoch milliseconds. Frames the
+client sends on such a connection use the same encoding.
+
+Every binary frame starts with one flag byte: PLAIN for a bare MessagePack
+body, DEFLATE for a raw-deflate (zlib wbits -15) body. Bodies of at least
+WS_COMPRESS_MIN_BYTES are deflated when that makes them smaller, which is
+what the notification replay batch and other multi-item frames hit; chat
+messages stay under it and cost no compression. Daphne has no setting for
+the permessage-deflate extension, so compression is done here, per frame.
+
+Broadcast events carry only the JSON frame, so channel-layer traffic is the
+same whatever clients are connected. Compact connections pack it on
+delivery through pack_frame, which is memoized per process: a room still
+packs each message once per worker, not once per recipient.
+"""
+import json
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+import msgpack
+from django.conf import settings
+
+SUBPROTOCOL = "healchat.msgpack.v1"
+PLAIN, DEFLATE = 0, 1
+
+SHORT_KEYS = {
+    "type": "t",
+    "id": "i",
+    "sender": "s",
+    "sender_id": "si",
+    "receiver": "r",
+    "client_msg_id": "c",
+    "message": "m",
+    "message_id": "mi",
+    "timestamp": "ts",
+    "is_anonymous": "a",
+    "user_id": "u",
+    "username": "un",
+    "status": "st",
+    "count": "n",
+    "link": "l",
+    "items": "it",
+    "ids": "is",
+}
+LONG_KEYS = {short: key for key, short in SHORT_KEYS.items()}
+
+
+def _shorten(value):
+    if isinstance(value, dict):
+        short = {}
+        for key, item in value.items():
+            if key == "timestamp" and isinstance(item, str):
+                item = int(datetime.fromisoformat(item).timestamp() * 1000)
+            short[SHORT_KEYS.get(key, key)] = _shorten(item)
+        return short
+    if isinstance(value, list):
+        return [_shorten(item) for item in value]
+    return value
+
+
+def _lengthen(value):
+    if isinstance(value, dict):
+        return {LONG_KEYS.get(key, key): _lengthen(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_lengthen(item) for item in value]
+    return value
+
+
+def pack(payload):
+    """Binary frame for a JSON-style payload dict."""
+    body = msgpack.packb(_shorten(payload), use_bin_type=True)
+    if len(body) >= settings.WS_COMPRESS_MIN_BYTES:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = deflater.compress(body) + deflater.flush()
+        if len(deflated) < len(body):
+            return bytes((DEFLATE,)) + deflated
+    return bytes((PLAIN,)) + body
+
+
+def unpack(frame):
+    """Payload dict (long keys) of a binary frame from a compact client."""
+    if not frame:
+        raise ValueError("Empty frame")
+    body = frame[1:]
+    if frame[0] == DEFLATE:
+        inflater = zlib.decompressobj(-15)
+        body = inflater.decompress(body, settings.WS_INFLATE_MAX_BYTES)
+        if inflater.unconsumed_tail:
+            raise ValueError("Frame inflates past WS_INFLATE_MAX_BYTES")
+    elif frame[0] != PLAIN:
+        raise ValueError(f"Unknown frame flag {frame[0]}")
+    payload = _lengthen(msgpack.unpackb(body, raw=False))
+    if not isinstance(payload, dict):
+        raise ValueError("Frame is not a map")
+    return payload
+
+
+@lru_cache(maxsize=256)
+def pack_frame(frame):
+    """pack() of an already encoded JSON frame, shared by every socket it goes to."""
+    return pack(json.loads(frame))
+
+
+class CompactFramingMixin:
+    """
+    Mix in ahead of BoundedSendMixin. Consumers call accept_negotiated()
+    instead of accept(), decode() on incoming frames and send_payload() /
+    send_frame() to send.
+    """
+    compact = False
+
+    async def accept_negotiated(self):
+        self.compact = SUBPROTOCOL in self.scope.get("subprotocols", ())
+        await self.accept(subprotocol=SUBPROTOCOL if self.compact else None)
+
+    def decode(self, text_data=None, bytes_data=None):
+        """The incoming frame as a dict, or None if it cannot be read."""
+        try:
+            if bytes_data is not None:
+                return unpack(bytes_data) if self.compact else None
+            data = json.loads(text_data)
+        except (ValueError, TypeError, zlib.error) as e:
+            print(f"WebSocket frame error: {e}")
+            return None
+        return data if isinstance(data, dict) else None
+
+    async def send_payload(self, payload, coalesce_key=None):
+        if self.compact:
+            await self.send(bytes_data=pack(payload), coalesce_key=coalesce_key)
+        else:
+            await self.send(text_data=json.dumps(payload), coalesce_key=coalesce_key)
+
+    async def send_frame(self, frame, coalesce_key=None):
+        """Sends a JSON-encoded frame in this connection's format."""
+        if self.compact:
+            await self.send(bytes_data=pack_frame(frame), coalesce_key=coalesce_key)
+        else:
+            await self.send(text_data=frame, coalesce_key=coalesce_key)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from channels.layers import InMemoryChannelLayer
+from channels.consumer import get_handler_name
+from django.core.management.base import BaseCommand
+
+from group.channel_layer import Broker, UnixSocketChannelLayer
+from group.consumers import DirectChatConsumer, GroupChatConsumer, NotificationConsumer
+
+
+def _serve_broker(path, capacity):
+    asyncio.run(Broker(path, capacity=capacity).serve())
+
+
+async def _discard(message):
+    pass
+
+
+def _consumer(cls, user_id):
+    # The real consumer class, minus the websocket: handlers run as they do
+    # in production and their output frames are thrown away.
+    consumer = cls()
+    consumer.scope = {"user": SimpleNamespace(id=user_id, is_authenticated=True)}
+    consumer.base_send = _discard
+    return consumer
+
+
+async def _drain(layer, channel, consumer, expected):
+    for _ in range(expected):
+        message = await layer.receive(channel)
+        await getattr(consumer, get_handler_name(message))(message)
+
+
+def _group_event(i):
+    return {"type": "chat.message", "frame": json.dumps({
+        "id": i, "sender": "alice", "sender_id": 1, "client_msg_id": None,
+        "message": f"message {i} to the support group", "timestamp": "2026-01-01T10:00:00+00:00",
+        "is_anonymous": False,
+    })}
+
+
+def _direct_event(i):
+    return {
+        "type": "direct.message", "id": i, "sender": "alice", "receiver": "bob",
+        "message": f"direct message {i}", "timestamp": "2026-01-01T10:00:00+00:00",
+    }
+
+
+def _notification_event(i):
+    return {
+        "type": "send_notification", "notification": {
+            "id": i, "sender": "alice", "count": 1, "message": f"direct message {i}",
+            "link": "/groups/chat/alice/", "timestamp": "2026-01-01T10:00:00+00:00",
+        },
+    }
+
+
+async def _scenario(layer, name, messages, members):
+    """
+    group:        `members` GroupChatConsumers in one group, one group_send per message.
+    direct:       both DirectChatConsumers of a conversation plus the receiver's
+                  NotificationConsumer; two group_sends per message, as in receive().
+    notification: `members` NotificationConsumers, each in its own user_<id>
+                  group, messages sent round-robin.
+    Returns (deliveries, seconds).
+    """
+    receivers = []
+    sends = []
+    if name == "group":
+        for uid in range(members):
+            channel = await layer.new_channel()
+            await layer.group_add("group_bench", channel)
+            receivers.append((channel, _consumer(GroupChatConsumer, uid), messages))
+        sends = [("group_bench", _group_event(i)) for i in range(messages)]
+    elif name == "direct":
+        for uid in (1, 2):
+            channel = await layer.new_channel()
+            await layer.group_add("direct_alice_bob", channel)
+            receivers.append((channel, _consumer(DirectChatConsumer, uid), messages))
+        channel = await layer.new_channel()
+        await layer.group_add("user_2", channel)
+        receivers.append((channel, _consumer(NotificationConsumer, 2), messages))
+        for i in range(messages):
+            sends.append(("direct_alice_bob", _direct_event(i)))
+            sends.append(("user_2", _notification_event(i)))
+    else:
+        per_user = messages // members
+        for uid in range(members):
+            channel = await layer.new_channel()
+            await layer.group_add(f"user_{uid}", channel)
+            receivers.append((channel, _consumer(NotificationConsumer, uid), per_user))
+        sends = [(f"user_{i % members}", _notification_event(i)) for i in range(per_user * members)]
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(_drain(layer, *r)) for r in receivers]
+    for group, event in sends:
+        await layer.group_send(group, event)
+    await asyncio.gather(*tasks)
+    return sum(r[2] for r in receivers), time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Compares UnixSocketChannelLayer with InMemoryChannelLayer on the group, DM and notification consumers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--members", type=int, default=50,
+                            help="Receivers in the group and notification scenarios.")
+        parser.add_argument("--path", help="Use a broker already running on this socket.")
+
+    def handle(self, *args, **options):
+        messages, members = options["messages"], options["members"]
+        # Big enough that no scenario ever hits ChannelFull.
+        capacity = messages * 2 + 10
+
+        broker = None
+        path = options["path"]
+        if not path:
+            path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+            broker = multiprocessing.Process(target=_serve_broker, args=(path, capacity), daemon=True)
+            broker.start()
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+
+        try:
+            for scenario in ("group", "direct", "notification"):
+                for label, make in (
+                    ("in-memory", lambda: InMemoryChannelLayer(capacity=capacity)),
+                    ("unix-socket", lambda: UnixSocketChannelLayer(path=path, capacity=capacity)),
+                ):
+                    deliveries, secs = asyncio.run(self._run(make, scenario, messages, members))
+                    self.stdout.write(
+                        f"{scenario:<13}{label:<13}{deliveries:>8} deliveries  "
+                        f"{deliveries / secs:>10,.0f}/s"
+                    )
+        finally:
+            if broker is not None:
+                broker.terminate()
+                broker.join()
+
+    async def _run(self, make, scenario, messages, members):
+        layer = make()
+        try:
+            await layer.flush()
+            return await _scenario(layer, scenario, messages, members)
+        finally:
+            await layer.close()
@@ -0,0 +1,88 @@
+import asyncio
+import copy
+import json
+import time
+from types import SimpleNamespace
+
+from channels.consumer import get_handler_name
+from django.core.management.base import BaseCommand
+
+from group.consumers import GroupChatConsumer
+
+MESSAGE = {
+    "id": 1, "sender": "alice", "sender_id": 1, "client_msg_id": None,
+    "message": "Has anyone tried the breathing exercise from yesterday's session?",
+    "timestamp": "2026-01-01T10:00:00+00:00", "is_anonymous": False,
+}
+
+
+class PerRecipientConsumer(GroupChatConsumer):
+    """GroupChatConsumer as it was before frames were encoded once per send."""
+
+    async def chat_message(self, event):
+        is_me = (event["sender_id"] == self.scope["user"].id)
+
+        await self.send(text_data=json.dumps({
+            "id": event["id"],
+            "sender": event["sender"],
+            "message": event["message"],
+            "timestamp": event["timestamp"],
+            "is_anonymous": event["is_anonymous"],
+            "is_me": is_me
+        }))
+
+
+def per_recipient_event():
+    event = {k: v for k, v in MESSAGE.items() if k != "client_msg_id"}
+    event["type"] = "chat.message"
+    return event
+
+
+def encoded_once_event():
+    return {"type": "chat.message", "frame": json.dumps(MESSAGE)}
+
+
+async def _discard(message):
+    pass
+
+
+async def _broadcast_cpu(cls, make_event, members, broadcasts):
+    """
+    CPU seconds per broadcast: building the event plus, for every member,
+    the copy a channel layer makes on delivery and the consumer's handler.
+    (The layer's own bookkeeping is left out; InMemoryChannelLayer rescans
+    every channel on each receive, which would swamp the comparison.)
+    """
+    consumers = []
+    for uid in range(1, members + 1):
+        consumer = cls()
+        consumer.scope = {"user": SimpleNamespace(id=uid, is_authenticated=True)}
+        consumer.base_send = _discard
+        consumers.append(consumer)
+
+    start = time.process_time()
+    for _ in range(broadcasts):
+        event = make_event()
+        for consumer in consumers:
+            message = copy.deepcopy(event)
+            await getattr(consumer, get_handler_name(message))(message)
+    return (time.process_time() - start) / broadcasts
+
+
+class Command(BaseCommand):
+    help = "CPU per group broadcast in a large room: per-recipient json.dumps vs one frame per send."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=5000)
+        parser.add_argument("--broadcasts", type=int, default=20)
+
+    def handle(self, *args, **options):
+        members, broadcasts = options["members"], options["broadcasts"]
+        results = {}
+        for label, cls, make_event in (
+            ("per-recipient", PerRecipientConsumer, per_recipient_event),
+            ("encoded-once", GroupChatConsumer, encoded_once_event),
+        ):
+            results[label] = asyncio.run(_broadcast_cpu(cls, make_event, members, broadcasts))
+            self.stdout.write(f"{label:<15}{results[label] * 1000:>9.1f} ms CPU per broadcast to {members} members")
+        self.stdout.write(f"{results['per-recipient'] / results['encoded-once']:.1f}x less CPU")
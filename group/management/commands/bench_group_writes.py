@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from group import write_behind
+from group.models import Group, GroupMessage
+from group.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+SLUG = "bench-group-writes"
+
+
+async def _client(app, user, messages):
+    comm = WebsocketCommunicator(app, f"/ws/groups/{SLUG}/")
+    comm.scope["user"] = user
+    connected, _ = await comm.connect()
+    if not connected:
+        raise RuntimeError(f"{user.username} could not join {SLUG}")
+    return comm
+
+
+async def _talk(comm, user, messages):
+    # Sends everything, then waits for its own echoes: a message is only
+    # broadcast once the consumer is done with it.
+    for i in range(messages):
+        await comm.send_json_to({"message": f"load test message {i}", "is_anonymous": False})
+    echoed = 0
+    while echoed < messages:
+        data = await comm.receive_json_from(timeout=30)
+        # Frames carry no is_me; our own messages are the ones with our id.
+        echoed += data.get("sender_id") == user.id
+
+
+class Command(BaseCommand):
+    help = ("Load-tests GroupChatConsumer with and without GROUP_WRITE_BEHIND. "
+            "Creates temporary bench users and a group, and deletes them afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20)
+        parser.add_argument("--messages", type=int, default=50, help="Messages per client.")
+
+    def handle(self, *args, **options):
+        clients, messages = options["clients"], options["messages"]
+        owner, _ = User.objects.get_or_create(username="bench_writes_0")
+        users = [owner] + [User.objects.get_or_create(username=f"bench_writes_{i}")[0] for i in range(1, clients)]
+        group, _ = Group.objects.get_or_create(slug=SLUG, defaults={"name": SLUG, "created_by": owner})
+        group.members.add(*users)
+
+        # Every socket receives every message; give the in-memory layer room
+        # for all of them so the numbers measure the database, not drops.
+        layers = {"default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {"capacity": clients * messages + 100},
+        }}
+        try:
+            for write_behind_on in (False, True):
+                with override_settings(GROUP_WRITE_BEHIND=write_behind_on, CHANNEL_LAYERS=layers):
+                    before = GroupMessage.objects.filter(group=group).count()
+                    broadcast, durable = asyncio.run(self._run(users, messages))
+                    stored = GroupMessage.objects.filter(group=group).count() - before
+                total = clients * messages
+                label = "write-behind" if write_behind_on else "write-through"
+                self.stdout.write(
+                    f"{label:<14}{total:>7} msgs  broadcast {total / broadcast:>8,.0f} msg/s  "
+                    f"durable {total / durable:>8,.0f} msg/s  ({stored} rows stored)"
+                )
+        finally:
+            group.delete()
+            User.objects.filter(username__startswith="bench_writes_").delete()
+
+    async def _run(self, users, messages):
+        app = URLRouter(websocket_urlpatterns)
+        comms = [await _client(app, u, messages) for u in users]
+        start = time.perf_counter()
+        await asyncio.gather(*(_talk(c, u, messages) for c, u in zip(comms, users)))
+        broadcast = time.perf_counter() - start
+        await sync_to_async(write_behind.get_writer().flush)()
+        durable = time.perf_counter() - start
+        for c in comms:
+            await c.disconnect()
+        return broadcast, durable
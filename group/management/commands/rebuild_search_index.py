@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from group import search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over group messages, DMs and chatbot history."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = search_index.rebuild()
+        self.stdout.write(f"Indexed {count} messages in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,26 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from group.channel_layer import Broker
+
+
+class Command(BaseCommand):
+    help = "Runs the Unix-socket broker behind group.channel_layer.UnixSocketChannelLayer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Socket path (defaults to the channel layer CONFIG).")
+        parser.add_argument("--alias", default="default", help="Which CHANNEL_LAYERS entry to serve.")
+
+    def handle(self, *args, **options):
+        config = dict(settings.CHANNEL_LAYERS.get(options["alias"], {}).get("CONFIG", {}))
+        config.setdefault("path", "/tmp/healchat-channels.sock")
+        if options["path"]:
+            config["path"] = options["path"]
+
+        self.stdout.write(f"Channel broker listening on {config['path']}")
+        try:
+            asyncio.run(Broker(**config).serve())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0005_groupmessage_is_anonymous'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directmessage',
+            name='polarity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='polarity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
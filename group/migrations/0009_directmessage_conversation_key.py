@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_conversation_keys(apps, schema_editor):
+    DirectMessage = apps.get_model('group', 'DirectMessage')
+    pairs = DirectMessage.objects.values_list('sender_id', 'receiver_id').distinct()
+    for sender_id, receiver_id in pairs:
+        low, high = sorted((sender_id, receiver_id))
+        DirectMessage.objects.filter(sender_id=sender_id, receiver_id=receiver_id).update(
+            conversation_key=f"{low}:{high}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0008_groupmessage_group_ts_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directmessage',
+            name='conversation_key',
+            field=models.CharField(default='', editable=False, max_length=41),
+        ),
+        migrations.RunPython(fill_conversation_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='directmessage',
+            index=models.Index(fields=['conversation_key', 'timestamp', 'id'], name='dm_conv_ts_id'),
+        ),
+    ]
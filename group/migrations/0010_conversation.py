@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def fill_conversations(apps, schema_editor):
+    DirectMessage = apps.get_model('group', 'DirectMessage')
+    Conversation = apps.get_model('group', 'Conversation')
+    ConversationParticipant = apps.get_model('group', 'ConversationParticipant')
+    keys = DirectMessage.objects.order_by().values_list('conversation_key', flat=True).distinct()
+    for key in keys:
+        last = DirectMessage.objects.filter(conversation_key=key).order_by('-timestamp', '-id').first()
+        conv = Conversation.objects.create(
+            key=key, last_message=last,
+            last_message_preview=last.content[:120], last_message_at=last.timestamp,
+        )
+        unread = dict(
+            DirectMessage.objects.filter(conversation_key=key, is_read=False)
+            .exclude(sender_id=F('receiver_id'))
+            .values('receiver_id').annotate(n=Count('id')).values_list('receiver_id', 'n')
+        )
+        for user_id, other_id in {(last.sender_id, last.receiver_id), (last.receiver_id, last.sender_id)}:
+            ConversationParticipant.objects.create(
+                conversation=conv, user_id=user_id, other_user_id=other_id,
+                last_message_at=last.timestamp, unread_count=unread.get(user_id, 0),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0009_directmessage_conversation_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=41, unique=True)),
+                ('last_message_preview', models.CharField(blank=True, max_length=120)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='group.directmessage')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='group.conversation')),
+                ('other_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'last_message_at'], name='convpart_user_last_msg')],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'user'), name='unique_conversation_participant')],
+            },
+        ),
+        migrations.RunPython(fill_conversations, migrations.RunPython.noop),
+    ]
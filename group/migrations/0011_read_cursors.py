@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def fill_read_cursors(apps, schema_editor):
+    Group = apps.get_model('group', 'Group')
+    GroupMessage = apps.get_model('group', 'GroupMessage')
+    GroupReadCursor = apps.get_model('group', 'GroupReadCursor')
+    DirectMessage = apps.get_model('group', 'DirectMessage')
+    ConversationParticipant = apps.get_model('group', 'ConversationParticipant')
+    Seen = GroupMessage.seen_by.through
+
+    # Groups: a member's cursor is the newest message they were marked as
+    # having seen. Members with no seen_by rows start at the newest message;
+    # nothing recorded reads before, so older history counts as read.
+    cursors = []
+    for group in Group.objects.all():
+        newest = GroupMessage.objects.filter(group=group).aggregate(m=Max('id'))['m'] or 0
+        seen = dict(
+            Seen.objects.filter(groupmessage__group=group)
+            .values('user_id').annotate(m=Max('groupmessage_id')).values_list('user_id', 'm')
+        )
+        for user_id in group.members.values_list('id', flat=True):
+            cursors.append(GroupReadCursor(
+                group=group, user_id=user_id, last_read_message_id=seen.get(user_id, newest),
+            ))
+    GroupReadCursor.objects.bulk_create(cursors, batch_size=500)
+
+    # DMs: everything before the oldest unread message counts as read.
+    for part in ConversationParticipant.objects.select_related('conversation'):
+        received = DirectMessage.objects.filter(
+            conversation_key=part.conversation.key, receiver_id=part.user_id
+        ).exclude(sender_id=part.user_id)
+        first_unread = received.filter(is_read=False).aggregate(m=Min('id'))['m']
+        if first_unread is None:
+            part.last_read_message_id = part.conversation.last_message_id or 0
+        else:
+            part.last_read_message_id = first_unread - 1
+        part.unread_count = received.filter(id__gt=part.last_read_message_id).count()
+        part.save(update_fields=['last_read_message_id', 'unread_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0010_conversation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='directmessage',
+            index=models.Index(fields=['conversation_key', 'id'], name='dm_conv_id'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'id'], name='groupmsg_group_id'),
+        ),
+        migrations.AddField(
+            model_name='groupreadcursor',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='group.group'),
+        ),
+        migrations.AddField(
+            model_name='groupreadcursor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_read_cursors', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='groupreadcursor',
+            constraint=models.UniqueConstraint(fields=('group', 'user'), name='unique_group_read_cursor'),
+        ),
+        migrations.RunPython(fill_read_cursors, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='directmessage',
+            name='is_read',
+        ),
+        migrations.RemoveField(
+            model_name='groupmessage',
+            name='seen_by',
+        ),
+    ]
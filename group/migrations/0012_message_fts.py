@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0011_read_cursors'),
+        ('chatbot', '0011_chatmessage_user_created_id_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE message_fts USING fts5("
+                "body, acl, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')",
+                "INSERT INTO message_fts (rowid, body, acl) "
+                "SELECT id * 4 + 1, content, 'g' || group_id FROM group_groupmessage",
+                "INSERT INTO message_fts (rowid, body, acl) "
+                "SELECT id * 4 + 2, content, 'u' || sender_id || ' u' || receiver_id FROM group_directmessage",
+                "INSERT INTO message_fts (rowid, body, acl) "
+                "SELECT id * 4 + 3, message || char(10) || response, 'c' || user_id "
+                "FROM chatbot_chatmessage WHERE user_id IS NOT NULL",
+            ],
+            reverse_sql="DROP TABLE message_fts",
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def fill_missing_read_cursors(apps, schema_editor):
+    # Members who joined after 0011 have no cursor yet; from now on one is
+    # made on join. Start them at the newest message, as that would have.
+    Group = apps.get_model('group', 'Group')
+    GroupMessage = apps.get_model('group', 'GroupMessage')
+    GroupReadCursor = apps.get_model('group', 'GroupReadCursor')
+
+    cursors = []
+    for group in Group.objects.all():
+        has_cursor = GroupReadCursor.objects.filter(group=group).values_list('user_id', flat=True)
+        missing = group.members.exclude(id__in=has_cursor).values_list('id', flat=True)
+        if not missing:
+            continue
+        newest = GroupMessage.objects.filter(group=group).aggregate(m=Max('id'))['m'] or 0
+        for user_id in missing:
+            cursors.append(GroupReadCursor(group=group, user_id=user_id, last_read_message_id=newest))
+    GroupReadCursor.objects.bulk_create(cursors, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0014_notification_is_delivered'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_read_cursors, migrations.RunPython.noop),
+    ]
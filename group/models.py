@@ -1,6 +1,10 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import timedelta
 
 User = settings.AUTH_USER_MODEL
 
@@ -29,22 +33,272 @@ class GroupMessage(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="messages")
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
-    seen_by = models.ManyToManyField(User, related_name="seen_group_messages", blank=True)
+    # Not auto_now_add: write-behind batches set the broadcast time themselves.
+    timestamp = models.DateTimeField(default=timezone.now)
     is_anonymous = models.BooleanField(default=False)
+    polarity = models.FloatField(null=True, blank=True)
 
     class Meta:
         ordering = ("timestamp",)
+        indexes = [
+            models.Index(fields=["group", "timestamp", "id"], name="groupmsg_group_ts_id"),
+            models.Index(fields=["group", "id"], name="groupmsg_group_id"),
+        ]
+
+
+class GroupReadCursor(models.Model):
+    """
+    How far a member has read a group: every message with an id up to
+    last_read_message_id. One row per (group, member) instead of one per
+    (message, reader).
+
+    Relies on ids growing with time, which is why GROUP_WRITE_BEHIND is
+    limited to a single worker. A member's cursor is created when they join
+    (group.signals), at the group's newest message.
+    """
+    # Unread counts stop here; the sidebar shows it as "99+".
+    UNREAD_CAP = 100
+
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="read_cursors")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="group_read_cursors")
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["group", "user"], name="unique_group_read_cursor"),
+        ]
+
+    @classmethod
+    def mark_read(cls, group_id, user_id, message_id):
+        """Moves the cursor forward to message_id (never back). True if it moved."""
+        if cls.objects.filter(
+            group_id=group_id, user_id=user_id, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id):
+            return True
+        _, created = cls.objects.get_or_create(
+            group_id=group_id, user_id=user_id, defaults={"last_read_message_id": message_id}
+        )
+        return created
+
+    @classmethod
+    def start_at_latest(cls, group_id, user_ids):
+        """
+        Cursors for new members at the group's newest message, so what was
+        posted before they joined never counts as unread. Existing cursors
+        are left alone.
+        """
+        latest = GroupMessage.objects.filter(group_id=group_id).aggregate(m=Max("id"))["m"] or 0
+        cls.objects.bulk_create(
+            [cls(group_id=group_id, user_id=uid, last_read_message_id=latest) for uid in user_ids],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def unread_counts(cls, user_id, slugs):
+        """
+        {slug: messages from others after the user's cursor} for the groups
+        `slugs`, in one query: a range count on (group, id) per group, capped
+        at UNREAD_CAP so a long-idle member costs no more than an active one.
+        """
+        last_read = cls.objects.filter(group=OuterRef("pk"), user_id=user_id).values("last_read_message_id")[:1]
+        unread = (
+            GroupMessage.objects
+            .filter(group=OuterRef("pk"), id__gt=OuterRef("last_read"))
+            .exclude(sender_id=user_id)
+        )
+        count = unread.order_by().values("group").annotate(n=Count("id")).values("n")
+        return dict(
+            Group.objects.filter(slug__in=slugs)
+            .annotate(last_read=Coalesce(Subquery(last_read), 0))
+            .annotate(unread=Case(
+                When(Exists(unread.values("id")[cls.UNREAD_CAP - 1:cls.UNREAD_CAP]), then=Value(cls.UNREAD_CAP)),
+                default=Coalesce(Subquery(count), 0),
+            ))
+            .values_list("slug", "unread")
+        )
+
+
+def conversation_key(user_a_id, user_b_id):
+    """Same value for both directions of a DM pair: "<lower id>:<higher id>"."""
+    low, high = sorted((user_a_id, user_b_id))
+    return f"{low}:{high}"
+
 
 class DirectMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sent_messages")
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="received_messages")
+    conversation_key = models.CharField(max_length=41, editable=False, default="")
     content = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    polarity = models.FloatField(null=True, blank=True)
 
     class Meta:
         ordering = ("timestamp",)
+        indexes = [
+            models.Index(fields=["conversation_key", "timestamp", "id"], name="dm_conv_ts_id"),
+            models.Index(fields=["conversation_key", "id"], name="dm_conv_id"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.conversation_key:
+            self.conversation_key = conversation_key(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
+
+
+class Conversation(models.Model):
+    """
+    One row per DM pair, kept up to date by record() from the DM save path,
+    so inboxes never have to scan DirectMessage.
+    """
+    key = models.CharField(max_length=41, unique=True)
+    last_message = models.ForeignKey(DirectMessage, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    last_message_preview = models.CharField(max_length=120, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    def record(cls, msg):
+        """Folds a newly saved DirectMessage in. Call inside the transaction that saved it."""
+        conv, _ = cls.objects.get_or_create(key=msg.conversation_key)
+        conv.last_message = msg
+        conv.last_message_preview = msg.content[:120]
+        conv.last_message_at = msg.timestamp
+        conv.save()
+
+        for user_id, other_id in ((msg.sender_id, msg.receiver_id), (msg.receiver_id, msg.sender_id)):
+            ConversationParticipant.objects.get_or_create(
+                conversation=conv, user_id=user_id, defaults={"other_user_id": other_id}
+            )
+        # The sender has read up to their own message; the receiver has one
+        # more unread. (For a note to self the sender branch wins.)
+        conv.participants.update(
+            last_message_at=msg.timestamp,
+            last_read_message_id=Case(
+                When(user_id=msg.sender_id, then=Value(msg.id)), default=F("last_read_message_id"),
+                output_field=models.PositiveBigIntegerField(),
+            ),
+            unread_count=Case(
+                When(user_id=msg.sender_id, then=F("unread_count")),
+                When(user_id=msg.receiver_id, then=F("unread_count") + 1),
+                default=F("unread_count"),
+            ),
+        )
+        return conv
+
+
+class ConversationParticipant(models.Model):
+    """A user's side of a Conversation: their inbox row."""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="participants")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversations")
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    # Copy of Conversation.last_message_at so the inbox is one index scan.
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    # Messages from other_user after last_read_message_id; maintained with
+    # the cursor so the inbox doesn't run a count per row.
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["conversation", "user"], name="unique_conversation_participant"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "last_message_at"], name="convpart_user_last_msg"),
+        ]
+
+    @classmethod
+    def mark_read(cls, key, user_id, message_id):
+        """
+        Moves the user's cursor in conversation `key` forward to message_id
+        and recounts what is left unread, in one UPDATE. True if it moved.
+        """
+        unread = (
+            DirectMessage.objects
+            .filter(conversation_key=key, receiver_id=user_id, id__gt=message_id)
+            .exclude(sender_id=user_id)
+            .order_by().values("conversation_key").annotate(n=Count("id")).values("n")
+        )
+        return bool(cls.objects.filter(
+            conversation__key=key, user_id=user_id, last_read_message_id__lt=message_id
+        ).update(
+            last_read_message_id=message_id,
+            unread_count=Coalesce(Subquery(unread), 0),
+        ))
+
+
+class Notification(models.Model):
+    """
+    A recipient's inbox entry for DMs from one sender. Messages arriving
+    while an unread entry is younger than NOTIFICATION_COALESCE_SECONDS are
+    folded into it ("3 new messages from X") instead of adding rows.
+    is_delivered is set once the entry, as it stands, has reached an open
+    page; only undelivered entries are replayed when a page connects.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    link = models.CharField(max_length=200)
+    preview = models.CharField(max_length=120, blank=True)
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+    is_read = models.BooleanField(default=False)
+    is_delivered = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["recipient", "is_read", "updated_at"], name="notif_recipient_unread"),
+        ]
+
+    @classmethod
+    def push(cls, recipient_id, sender_id, preview, link):
+        """Records one more message from sender; returns the (possibly coalesced) entry."""
+        now = timezone.now()
+        window = timedelta(seconds=settings.NOTIFICATION_COALESCE_SECONDS)
+        current = cls.objects.filter(
+            recipient_id=recipient_id, sender_id=sender_id, is_read=False, updated_at__gte=now - window
+        ).order_by("-updated_at").first()
+        if current is None:
+            return cls.objects.create(
+                recipient_id=recipient_id, sender_id=sender_id, link=link, preview=preview,
+                created_at=now, updated_at=now,
+            )
+        cls.objects.filter(pk=current.pk).update(
+            count=F("count") + 1, preview=preview, link=link, updated_at=now, is_delivered=False
+        )
+        current.count += 1
+        current.preview, current.link, current.updated_at = preview, link, now
+        current.is_delivered = False
+        return current
 
+    @classmethod
+    def mark_delivered(cls, frames):
+        """
+        Marks the entries behind `frames` (as_frame dicts) delivered in one
+        UPDATE, skipping any that had more messages folded in since.
+        """
+        match = Q(pk__in=[])
+        for frame in frames:
+            match |= Q(pk=frame["id"], count=frame["count"])
+        return cls.objects.filter(match).update(is_delivered=True)
 
+    @classmethod
+    def mark_read(cls, recipient_id, ids=None, sender_id=None):
+        """Marks the recipient's unread entries read in one UPDATE; returns how many."""
+        qs = cls.objects.filter(recipient_id=recipient_id, is_read=False)
+        if ids is not None:
+            qs = qs.filter(id__in=ids)
+        if sender_id is not None:
+            qs = qs.filter(sender_id=sender_id)
+        return qs.update(is_read=True)
 
+    def as_frame(self, sender_username):
+        return {
+            "id": self.id,
+            "sender": sender_username,
+            "count": self.count,
+            "message": self.preview,
+            "link": self.link,
+            "timestamp": self.updated_at.isoformat(),
+        }
@@ -0,0 +1,126 @@
+"""
+Full-text search over chat history (SQLite FTS5).
+
+One FTS5 table, message_fts, indexes group messages, DMs and chatbot
+exchanges. A row's rowid is the source row's id * 4 + its kind, so every
+source row has exactly one slot and results map straight back to it.
+
+The acl column holds who may see the row: "g<group id>" for group
+messages, "u<sender id> u<receiver id>" for DMs, "c<user id>" for chatbot
+history. Queries match the user's tokens against it inside the same FTS
+MATCH, so permission filtering happens in the index rather than by
+post-filtering ranked rows. Group access is resolved at query time from
+current membership, so joining or leaving needs no reindexing.
+
+Kept in sync by the post_save/post_delete receivers in group.signals;
+`manage.py rebuild_search_index` rebuilds it from scratch.
+"""
+import re
+
+from django.db import connection, transaction
+from django.utils.html import escape
+
+GROUP, DIRECT, CHATBOT = 1, 2, 3
+KINDS = {GROUP: "group", DIRECT: "direct", CHATBOT: "chatbot"}
+
+MAX_TERMS = 8
+MAX_OFFSET = 1000
+
+# What rebuild() copies in, as (kind, table, body SQL, acl SQL, filter SQL).
+# Chatbot rows without a user belong to nobody and are not indexed.
+SOURCES = [
+    (GROUP, "group_groupmessage", "content", "'g' || group_id", "1"),
+    (DIRECT, "group_directmessage", "content", "'u' || sender_id || ' u' || receiver_id", "1"),
+    (CHATBOT, "chatbot_chatmessage", "message || char(10) || response", "'c' || user_id", "user_id IS NOT NULL"),
+]
+
+
+def _rowid(kind, pk):
+    return pk * 4 + kind
+
+
+def group_message_doc(msg):
+    return _rowid(GROUP, msg.pk), msg.content, f"g{msg.group_id}"
+
+
+def direct_message_doc(msg):
+    return _rowid(DIRECT, msg.pk), msg.content, f"u{msg.sender_id} u{msg.receiver_id}"
+
+
+def chat_message_doc(msg):
+    if msg.user_id is None:
+        return None
+    return _rowid(CHATBOT, msg.pk), f"{msg.message}\n{msg.response}", f"c{msg.user_id}"
+
+
+def index(doc):
+    if doc is None:
+        return
+    rowid, body, acl = doc
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO message_fts (rowid, body, acl) VALUES (%s, %s, %s)",
+            [rowid, body, acl],
+        )
+
+
+def unindex(doc):
+    if doc is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM message_fts WHERE rowid = %s", [doc[0]])
+
+
+def rebuild():
+    """Refills the index from the source tables. Returns the number of rows indexed."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM message_fts")
+        for kind, table, body, acl, where in SOURCES:
+            cursor.execute(
+                f"INSERT INTO message_fts (rowid, body, acl) "
+                f"SELECT id * 4 + {kind}, {body}, {acl} FROM {table} WHERE {where}"
+            )
+        cursor.execute("INSERT INTO message_fts (message_fts) VALUES ('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM message_fts")
+        return cursor.fetchone()[0]
+
+
+def match_expression(query, acl_tokens):
+    """
+    FTS5 MATCH string for `query` limited to `acl_tokens`, or None if the
+    query has no searchable words. Words are quoted, so FTS5 operators in
+    user input are searched for literally. The last word also matches as a
+    prefix (search-as-you-type) once it has two characters, the shortest
+    prefix the table keeps an index for.
+    """
+    terms = re.findall(r"\w+", query)[:MAX_TERMS]
+    if not terms or not acl_tokens:
+        return None
+    phrases = [f'"{t}"' for t in terms]
+    if len(terms[-1]) >= 2:
+        phrases[-1] += " *"
+    return f"body : ({' '.join(phrases)}) AND acl : ({' OR '.join(acl_tokens)})"
+
+
+def search(query, acl_tokens, offset=0, limit=20):
+    """
+    Best matches first (bm25 on the body). Returns ([(kind, pk, snippet_html)],
+    has_more). snippet_html is escaped text with matches wrapped in <mark>.
+    """
+    expression = match_expression(query, acl_tokens)
+    if expression is None:
+        return [], False
+    offset = min(max(offset, 0), MAX_OFFSET)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rowid, snippet(message_fts, 0, char(2), char(3), '…', 16) "
+            "FROM message_fts WHERE message_fts MATCH %s "
+            "ORDER BY bm25(message_fts, 1.0, 0.0) LIMIT %s OFFSET %s",
+            [expression, limit + 1, offset],
+        )
+        rows = cursor.fetchall()
+    hits = [
+        (rowid % 4, rowid // 4, escape(snippet).replace("\x02", "<mark>").replace("\x03", "</mark>"))
+        for rowid, snippet in rows[:limit]
+    ]
+    return hits, len(rows) > limit
@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from chatbot.models import ChatMessage
+from . import search_index
+from .autocomplete import autocomplete
+from .models import DirectMessage, Group, GroupMessage, GroupReadCursor
+
+User = get_user_model()
+
+# Keeps the full-text index (group/search_index.py) in step with its sources.
+
+DOCS = {
+    GroupMessage: search_index.group_message_doc,
+    DirectMessage: search_index.direct_message_doc,
+    ChatMessage: search_index.chat_message_doc,
+}
+
+
+@receiver(post_save, sender=GroupMessage)
+@receiver(post_save, sender=DirectMessage)
+@receiver(post_save, sender=ChatMessage)
+def index_message(sender, instance, **kwargs):
+    try:
+        search_index.index(DOCS[sender](instance))
+    except Exception as e:
+        # The message is saved; rebuild_search_index can catch the index up.
+        print(f"Search index error: {e}")
+
+
+@receiver(post_delete, sender=GroupMessage)
+@receiver(post_delete, sender=DirectMessage)
+@receiver(post_delete, sender=ChatMessage)
+def unindex_message(sender, instance, **kwargs):
+    try:
+        search_index.unindex(DOCS[sender](instance))
+    except Exception as e:
+        print(f"Search index error: {e}")
+
+
+# Keeps the autocomplete index (group/autocomplete.py) current for renames,
+# sign-ups and deletions made by this process.
+
+@receiver(post_save, sender=User)
+def autocomplete_user_saved(sender, instance, **kwargs):
+    autocomplete.user_saved(instance)
+
+
+@receiver(post_delete, sender=User)
+def autocomplete_user_deleted(sender, instance, **kwargs):
+    autocomplete.user_deleted(instance)
+
+
+@receiver(post_save, sender=Group)
+def autocomplete_group_saved(sender, instance, **kwargs):
+    autocomplete.group_saved(instance)
+
+
+@receiver(post_delete, sender=Group)
+def autocomplete_group_deleted(sender, instance, **kwargs):
+    autocomplete.group_deleted(instance)
+
+
+# New members start reading at the group's newest message (see
+# GroupReadCursor), so its history does not show up as unread.
+
+@receiver(m2m_changed, sender=Group.members.through)
+def read_cursor_on_join(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        # user.groups_joined.add(...): the instance is the user.
+        for group_id in pk_set:
+            GroupReadCursor.start_at_latest(group_id, [instance.pk])
+    else:
+        GroupReadCursor.start_at_latest(instance.pk, pk_set)
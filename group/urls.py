@@ -7,11 +7,15 @@ urlpatterns = [
     path("", views.chat_home, name="chat_home"),
 
     path("search/", views.search, name="search"),
+    path("search/messages/", views.message_search, name="message_search"),
+    path("stats/sockets/", views.SocketStatsAPIView.as_view(), name="socket_stats"),
     path("create/", views.group_create, name="group_create"),
     path("<slug:slug>/info/", views.group_profile, name="group_profile"),
     path("<slug:slug>/join/", views.join_group, name="join_group"),
     path("<slug:slug>/leave/", views.leave_group, name="leave_group"),
     path("<slug:slug>/", views.group_chat, name="group_chat"),
     path("chat/<slug:username>/", views.direct_chat, name="direct_chat"),
+    path("chat/<slug:username>/messages/", views.direct_messages, name="direct_messages"),
+    path("<slug:slug>/messages/", views.group_messages, name="group_messages"),
     path('<slug:slug>/remove/<int:user_id>/', views.remove_member, name='remove_member'),
 ]
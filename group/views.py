@@ -1,77 +1,102 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from users.models import Profile
-from .models import Group, GroupMessage, DirectMessage
+from django.urls import reverse
+from users.views import sidebar_context
+from users import sidebar
+from .models import Group, GroupMessage, GroupReadCursor, DirectMessage, ConversationParticipant, Notification, conversation_key
 from .forms import CreateGroupForm, GroupUpdateForm 
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.gzip import gzip_page
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from django.http import JsonResponse
+from chatbot.sentiment import score_text
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .consumers import membership_channel_group, direct_room_name, receipt_event
+from users.presence import presence
+from chatbot.pagination import keyset_page, parse_limit
+from chatbot.models import ChatMessage
+from . import search_index
+from .autocomplete import RESULTS as AUTOCOMPLETE_RESULTS, autocomplete
+from . import backpressure
+from . import write_behind
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+HISTORY_PAGE_SIZE = 50
 
 User = get_user_model()
 
 @login_required
 def search(request):
-    q = request.GET.get("q", "").strip()
-    users_data = []
-    groups_data = []
-    
-    if q:
-        users_qs = User.objects.filter(username__icontains=q).exclude(id=request.user.id)[:10]
-        groups_qs = Group.objects.filter(name__icontains=q)[:10]
-    else:
-        users_qs = User.objects.none()
-        groups_qs = Group.objects.none()
-
-    for u in users_qs:
-        avatar_url = "/static/avatars/defaults/default1.png"
-
-        if hasattr(u, 'profile'):
-            avatar_url = u.profile.get_avatar_url() 
-
-        users_data.append({
-            "username": u.username,
-            "avatar": avatar_url,
-        })
-            
-    for g in groups_qs:
-        groups_data.append({
-            "name": g.name,
-            "slug": g.slug,
-        })
-
-    return JsonResponse({"users": users_data, "groups": groups_data})
-
+    """Sidebar autocomplete: users and groups whose names start with ?q=."""
+    result = autocomplete.search(request.GET.get("q", "").strip())
+    users_data = [
+        {"username": u["username"], "avatar": u["avatar"]}
+        for u in result["users"] if u["id"] != request.user.id
+    ][:AUTOCOMPLETE_RESULTS]
+    return JsonResponse({"users": users_data, "groups": result["groups"]})
 
-def sidebar_context(request):
-    if not request.user.is_authenticated:
-        return {}
 
-    groups_sidebar = Group.objects.filter(members=request.user).order_by("-created_at")
-
-    direct_msgs = DirectMessage.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).order_by("-timestamp")
-
-    user_ids = []
-    seen = set()
-    
-    for dm in direct_msgs:
-        other_id = dm.receiver_id if dm.sender_id == request.user.id else dm.sender_id
-        
-        if other_id not in seen:
-            seen.add(other_id)
-            user_ids.append(other_id)
-            if len(user_ids) >= 10: break
-    
-    
-    recent_users = User.objects.filter(id__in=user_ids)
-    
-
-    for u in recent_users:
-        if not hasattr(u, 'profile'):
-            Profile.objects.create(user=u)
-
-    return {"groups_sidebar": groups_sidebar, "recent_users": recent_users}
+@login_required
+def message_search(request):
+    """
+    Full-text search over the messages request.user can see (their DMs,
+    their chatbot history, groups they belong to), best match first:
+    ?q=<words>&offset=<n>&limit=<n>.
+    """
+    q = request.GET.get("q", "").strip()
+    limit = parse_limit(request.GET.get("limit"), default=20, maximum=50)
+    try:
+        offset = max(0, int(request.GET.get("offset", 0)))
+    except ValueError:
+        return JsonResponse({"error": "Invalid offset"}, status=400)
+
+    user = request.user
+    acl = [f"u{user.id}", f"c{user.id}"]
+    acl += [f"g{gid}" for gid in user.groups_joined.values_list("id", flat=True)]
+    hits, has_more = search_index.search(q, acl, offset, limit)
+
+    ids = {}
+    for kind, pk, _ in hits:
+        ids.setdefault(kind, []).append(pk)
+    rows = {
+        search_index.GROUP: GroupMessage.objects.select_related("group", "sender").in_bulk(ids.get(search_index.GROUP, [])),
+        search_index.DIRECT: DirectMessage.objects.select_related("sender", "receiver").in_bulk(ids.get(search_index.DIRECT, [])),
+        search_index.CHATBOT: ChatMessage.objects.in_bulk(ids.get(search_index.CHATBOT, [])),
+    }
+
+    results = []
+    for kind, pk, snippet in hits:
+        m = rows[kind].get(pk)
+        if m is None:
+            # Deleted since it was indexed.
+            continue
+        item = {"kind": search_index.KINDS[kind], "id": pk, "snippet": snippet}
+        if kind == search_index.GROUP:
+            item.update({
+                "timestamp": m.timestamp.isoformat(),
+                "sender": "Anonymous" if m.is_anonymous else m.sender.username,
+                "group": m.group.name,
+                "url": reverse("group:group_chat", args=[m.group.slug]),
+            })
+        elif kind == search_index.DIRECT:
+            other = m.receiver if m.sender_id == user.id else m.sender
+            item.update({
+                "timestamp": m.timestamp.isoformat(),
+                "sender": m.sender.username,
+                "with": other.username,
+                "url": reverse("group:direct_chat", args=[other.username]),
+            })
+        else:
+            item.update({
+                "timestamp": m.created_at.isoformat(),
+                "url": reverse("chatbot:chat_page"),
+            })
+        results.append(item)
+
+    return JsonResponse({"results": results, "next_offset": offset + len(hits) if has_more else None})
 
 
 @login_required
@@ -112,21 +137,58 @@ def group_chat(request, slug):
     if request.method == "POST" and is_member:
         content = request.POST.get("content", "").strip()
         if content:
-            GroupMessage.objects.create(group=group, sender=request.user, content=content)
+            write_behind.create_message(group=group, sender=request.user, content=content,
+                                        polarity=score_text(content))
             return redirect('group:group_chat', slug=slug)
 
-    chat_messages = group.messages.select_related('sender').all()[:200]
+    # Newest page only; older ones come from group_messages as the user
+    # scrolls up.
+    chat_messages, next_cursor = keyset_page(
+        group.messages.select_related('sender'), 'timestamp', limit=HISTORY_PAGE_SIZE
+    )
+    if is_member and chat_messages:
+        if GroupReadCursor.mark_read(group.id, request.user.id, max(m.id for m in chat_messages)):
+            sidebar.invalidate_unread(request.user.id)
 
     context = sidebar_context(request)
     context.update({
         "group": group,
         "chat_messages": chat_messages, 
+        "next_cursor": next_cursor,
         "is_member": is_member
     })
 
     return render(request, "groups/group_chat.html", context)
 
 
+@login_required
+@gzip_page
+def group_messages(request, slug):
+    """Older history for group_chat: ?before=<cursor>&limit=<n>. Members only."""
+    group = get_object_or_404(Group, slug=slug)
+    if not group.members.filter(id=request.user.id).exists():
+        return JsonResponse({"error": "Not a member of this group"}, status=403)
+    try:
+        rows, next_cursor = keyset_page(
+            group.messages.select_related('sender'), 'timestamp',
+            request.GET.get('before'), parse_limit(request.GET.get('limit'), default=HISTORY_PAGE_SIZE),
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    results = []
+    for m in rows:
+        results.append({
+            "id": m.id,
+            "sender": "Anonymous" if m.is_anonymous else m.sender.username,
+            "message": m.content,
+            "timestamp": m.timestamp.isoformat(),
+            "is_anonymous": m.is_anonymous,
+            "is_me": m.sender_id == request.user.id,
+        })
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
 @login_required
 def join_group(request, slug):
     group = get_object_or_404(Group, slug=slug)
@@ -134,7 +196,7 @@ def join_group(request, slug):
     if request.user not in group.members.all():
         group.members.add(request.user)
         
-        GroupMessage.objects.create(
+        write_behind.create_message(
             group=group,
             sender=request.user,
             content="joined the group.", 
@@ -148,28 +210,73 @@ def join_group(request, slug):
 def leave_group(request, slug):
     group = get_object_or_404(Group, slug=slug)
     group.members.remove(request.user)
+    revoke_sockets(group, request.user)
     return redirect('group:chat_home')
 
 
 @login_required
 def direct_chat(request, username):
     other_user = get_object_or_404(User, username=username)
-
-    chat_messages = DirectMessage.objects.filter(
-        Q(sender=request.user, receiver=other_user) |
-        Q(sender=other_user, receiver=request.user)
-    ).order_by("timestamp")
+    key = conversation_key(request.user.id, other_user.id)
+    Notification.mark_read(request.user.id, sender_id=other_user.id)
+
+    chat_messages, next_cursor = keyset_page(
+        DirectMessage.objects.filter(conversation_key=key),
+        'timestamp', limit=HISTORY_PAGE_SIZE
+    )
+    newest_id = max((m.id for m in chat_messages), default=0)
+    if newest_id and ConversationParticipant.mark_read(key, request.user.id, newest_id):
+        sidebar.invalidate(request.user.id)
+        async_to_sync(get_channel_layer().group_send)(
+            direct_room_name(request.user.username, other_user.username),
+            receipt_event(request.user, newest_id),
+        )
+    other_read_upto = ConversationParticipant.objects.filter(
+        conversation__key=key, user=other_user
+    ).values_list("last_read_message_id", flat=True).first() or 0
+    last = chat_messages[-1] if chat_messages else None
 
     context = sidebar_context(request)
     
     context.update({
         "other_user": other_user,
         "chat_messages": chat_messages, 
+        "next_cursor": next_cursor,
+        "show_seen": last is not None and last.sender_id == request.user.id and last.id <= other_read_upto,
+        "other_online": bool(presence.online_ids([other_user.id])),
+        "other_last_seen": presence.last_seen(other_user.id, other_user.profile.last_seen),
     })
 
     return render(request, "chat/direct_chat.html", context)
 
 
+@login_required
+@gzip_page
+def direct_messages(request, username):
+    """Older history for direct_chat: ?before=<cursor>&limit=<n>."""
+    other_user = get_object_or_404(User, username=username)
+    try:
+        rows, next_cursor = keyset_page(
+            DirectMessage.objects.filter(conversation_key=conversation_key(request.user.id, other_user.id)),
+            'timestamp', request.GET.get('before'),
+            parse_limit(request.GET.get('limit'), default=HISTORY_PAGE_SIZE),
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    results = []
+    for m in rows:
+        is_me = m.sender_id == request.user.id
+        results.append({
+            "id": m.id,
+            "sender": request.user.username if is_me else other_user.username,
+            "message": m.content,
+            "timestamp": m.timestamp.isoformat(),
+            "is_me": is_me,
+        })
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
 @login_required
 def group_profile(request, slug):
     group = get_object_or_404(Group, slug=slug)
@@ -204,6 +311,23 @@ def remove_member(request, slug, user_id):
     
     member_to_remove = get_object_or_404(User, id=user_id)
     group.members.remove(member_to_remove)
+    revoke_sockets(group, member_to_remove)
     
     return redirect('group:group_profile', slug=slug)
 
+
+def revoke_sockets(group, user):
+    """Closes `user`'s open chat sockets for `group` after they leave or are removed."""
+    async_to_sync(get_channel_layer().group_send)(
+        membership_channel_group(group.id, user.id),
+        {"type": "member.revoked"}
+    )
+
+
+class SocketStatsAPIView(APIView):
+    """WebSocket send-queue depth and drop counters for this process, for staff."""
+    authentication_classes = [SessionAuthentication, BasicAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(backpressure.stats())
@@ -0,0 +1,256 @@
+"""
+Write-behind persistence for group chat messages (GROUP_WRITE_BEHIND).
+
+With the setting on, GroupChatConsumer no longer waits for an INSERT before
+broadcasting. `submit()` gives the message its primary key and timestamp in
+memory and queues it; a daemon thread per process writes the queue with one
+bulk_create every GROUP_WRITE_BEHIND_INTERVAL_MS, or sooner once
+GROUP_WRITE_BEHIND_BATCH messages are waiting. Sentiment is scored for the
+whole batch at once in that thread.
+
+IDs: blocks of GROUP_WRITE_BEHIND_ID_BLOCK primary keys are reserved by
+bumping the table's sqlite_sequence row. Django creates SQLite AutoFields
+with AUTOINCREMENT, so rows inserted any other way always get ids above
+every reserved block and never collide with queued messages. Unused ids of
+a block are simply skipped. SQLite only.
+
+Read cursors rely on ids following the order messages were accepted, so
+every group message insert must take its id from the same allocator: the
+views use create_message() instead of GroupMessage.objects.create(). Blocks
+are per process, so settings refuses GROUP_WRITE_BEHIND together with
+CHANNEL_BROKER_SOCKET (several workers).
+
+Durability:
+- A message is durable once its batch commits, normally within one interval
+  of being broadcast. Until then it is visible to socket subscribers but not
+  to history queries.
+- "database is locked" errors are retried with backoff up to
+  GROUP_WRITE_BEHIND_RETRIES times per flush; after that the batch stays
+  queued (in order) and is retried on the next tick. Nothing is dropped.
+- The queue is flushed on interpreter exit (atexit), which covers normal
+  shutdown and SIGINT/SIGTERM handled by Daphne. A hard kill (SIGKILL, OOM,
+  power loss) loses whatever was still queued: at most one interval's worth.
+- A row that can never be written (its group was deleted while it was
+  queued) is dropped and logged; the rest of its batch is still saved.
+- bulk_create does not fire post_save, so the flusher sends it for every row
+  inside the batch transaction; mood aggregates and other receivers see each
+  message exactly as with Model.save().
+"""
+import atexit
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from chatbot.sentiment import score_texts
+from .models import GroupMessage
+
+
+class IdAllocator:
+    """Hands out primary keys from blocks reserved in sqlite_sequence."""
+
+    def __init__(self, model, block):
+        self.table = model._meta.db_table
+        self.pk_column = model._meta.pk.column
+        self.block = block
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def take(self):
+        """Next id, reserving a fresh block first if needed (hits the database)."""
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve()
+            pk = self._next
+            self._next += 1
+            return pk
+
+    def take_reserved(self):
+        """Next id from the current block, or None when a new block is needed."""
+        with self._lock:
+            if self._next >= self._end:
+                return None
+            pk = self._next
+            self._next += 1
+            return pk
+
+    def _reserve(self):
+        if connection.vendor != "sqlite":
+            raise ImproperlyConfigured("GROUP_WRITE_BEHIND needs SQLite (it reserves ids via sqlite_sequence)")
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s",
+                    [self.block, self.table],
+                )
+                if cursor.rowcount == 0:
+                    # The table has never had a row, so it has no sequence yet.
+                    cursor.execute(
+                        f'INSERT INTO sqlite_sequence (name, seq) '
+                        f'SELECT %s, COALESCE(MAX("{self.pk_column}"), 0) + %s FROM "{self.table}"',
+                        [self.table, self.block],
+                    )
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [self.table])
+                end = cursor.fetchone()[0]
+        return end - self.block + 1, end + 1
+
+
+class GroupMessageWriter:
+    def __init__(self, interval_ms, batch_size, retries, id_block):
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.retries = retries
+        self.ids = IdAllocator(GroupMessage, id_block)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+    def _start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-write-behind", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def enqueue(self, pk, group, sender, content, is_anonymous):
+        msg = GroupMessage(
+            id=pk, group=group, sender=sender, content=content,
+            is_anonymous=is_anonymous, timestamp=timezone.now(),
+        )
+        self._start()
+        with self._cond:
+            self._pending.append(msg)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return msg
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size,
+                    timeout=self.interval,
+                )
+                if self._stopping:
+                    return
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush error: {e}")
+
+    def flush(self):
+        """Writes everything queued so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+
+            for msg, polarity in zip(batch, score_texts([m.content for m in batch])):
+                if msg.polarity is None:
+                    msg.polarity = polarity
+
+            for attempt in range(self.retries + 1):
+                try:
+                    with transaction.atomic():
+                        GroupMessage.objects.bulk_create(batch)
+                        self._saved(batch)
+                    written = batch
+                    break
+                except OperationalError as e:
+                    if "locked" not in str(e) or attempt == self.retries:
+                        # Leave the batch queued; the next tick retries it.
+                        raise
+                    time.sleep(min(1.0, 0.02 * (2 ** attempt)))
+                except IntegrityError:
+                    written = self._write_one_by_one(batch)
+                    break
+
+            with self._cond:
+                del self._pending[:len(batch)]
+        return len(written)
+
+    def _saved(self, msgs):
+        # bulk_create skips post_save. Sending it inside the batch's
+        # transaction means receivers (mood aggregates) write under the lock
+        # the INSERT already holds instead of queueing for it again.
+        for msg in msgs:
+            post_save.send(sender=GroupMessage, instance=msg, created=True,
+                           update_fields=None, raw=False, using="default")
+
+    def _write_one_by_one(self, batch):
+        # Some row can never be written (e.g. its group was deleted while it
+        # was queued); save the rest rather than wedging the queue.
+        written = []
+        for msg in batch:
+            try:
+                with transaction.atomic():
+                    GroupMessage.objects.bulk_create([msg])
+                    self._saved([msg])
+                written.append(msg)
+            except IntegrityError as e:
+                print(f"Write-behind dropped message {msg.id}: {e}")
+        return written
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        while self._pending:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind final flush error: {e}; {len(self._pending)} messages lost")
+                return
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupMessageWriter(
+                    settings.GROUP_WRITE_BEHIND_INTERVAL_MS,
+                    settings.GROUP_WRITE_BEHIND_BATCH,
+                    settings.GROUP_WRITE_BEHIND_RETRIES,
+                    settings.GROUP_WRITE_BEHIND_ID_BLOCK,
+                )
+    return _writer
+
+
+def create_message(**fields):
+    """
+    GroupMessage.objects.create() for inserts outside the consumer. With
+    GROUP_WRITE_BEHIND on, the id comes from the write-behind allocator so
+    it sorts after every message already queued in this process.
+    """
+    if settings.GROUP_WRITE_BEHIND:
+        fields["id"] = get_writer().ids.take()
+    return GroupMessage.objects.create(**fields)
+
+
+async def submit(group, sender, content, is_anonymous):
+    """
+    Queues a GroupMessage and returns it with id and timestamp set. Only
+    touches the database when a new id block has to be reserved.
+    """
+    writer = get_writer()
+    pk = writer.ids.take_reserved()
+    if pk is None:
+        pk = await database_sync_to_async(writer.ids.take)()
+    return writer.enqueue(pk, group, sender, content, is_anonymous)
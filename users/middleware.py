@@ -1,16 +1,11 @@
-from django.utils import timezone
-from django.conf import settings
+from .presence import presence
 
 class UpdateLastSeenMiddleware:
+    """Marks the user active; users.presence writes last_seen in batches."""
     def __init__(self, get_response):
         self.get_response = get_response
     def __call__(self, request):
         response = self.get_response(request)
-        try:
-            if request.user.is_authenticated:
-                profile = request.user.profile
-                profile.last_seen = timezone.now()
-                profile.save(update_fields=["last_seen"])
-        except Exception:
-            pass
+        if request.user.is_authenticated:
+            presence.touch(request.user.id)
         return response
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 import os
+from .presence import presence
 
 def upload_avatar(instance, filename):
     return f"avatars/{instance.user.username}/{filename}"
@@ -23,10 +24,8 @@ class Profile(models.Model):
             return f"/static/avatars/defaults/{self.preset_avatar}"
         return "/static/avatars/defaults/default1.png"
 
-    def is_online(self, timeout_seconds=60):
-        if not self.last_seen:
-            return False
-        return (timezone.now() - self.last_seen).total_seconds() < timeout_seconds
+    def is_online(self):
+        return presence.is_online(self.user_id, self.last_seen)
 
     def __str__(self):
         return self.user.username
@@ -0,0 +1,144 @@
+"""
+In-memory presence.
+
+Who is online is tracked per process from the notification socket that every
+page opens (connect/disconnect, plus a heartbeat from the page) and from
+authenticated HTTP requests, without touching the database. Profile.last_seen
+is written back in batches: a daemon thread flushes every
+PRESENCE_FLUSH_INTERVAL seconds with a single UPDATE, refreshing users who
+are still connected so the column stays current for other processes.
+
+A user is online when this process holds an open socket for them, they were
+seen here within PRESENCE_TIMEOUT seconds, or their flushed last_seen is that
+recent (which covers sockets held by other worker processes).
+
+disconnect() only knows about this process, so NotificationConsumer also
+checks the user's channel-layer group, which spans workers, before it
+announces that the user went offline.
+"""
+import atexit
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+FLUSH_CHUNK = 500
+
+
+class Presence:
+    def __init__(self, timeout, flush_interval):
+        self.timeout = timedelta(seconds=timeout)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._sockets = {}      # user id -> open sockets in this process
+        self._seen = {}         # user id -> last activity
+        self._dirty = set()     # user ids whose last activity is not flushed yet
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="presence-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def touch(self, user_id):
+        with self._lock:
+            self._seen[user_id] = timezone.now()
+            self._dirty.add(user_id)
+            self._start()
+
+    def connect(self, user_id):
+        """Registers a socket; True if it is the user's first one here."""
+        with self._lock:
+            count = self._sockets.get(user_id, 0) + 1
+            self._sockets[user_id] = count
+        self.touch(user_id)
+        return count == 1
+
+    def disconnect(self, user_id):
+        """Unregisters a socket; True if it was the user's last one here."""
+        with self._lock:
+            count = self._sockets.get(user_id, 0) - 1
+            if count > 0:
+                self._sockets[user_id] = count
+            else:
+                self._sockets.pop(user_id, None)
+        self.touch(user_id)
+        return count <= 0
+
+    def last_seen(self, user_id, stored=None):
+        """Most recent activity we know of: ours or the flushed `stored` value."""
+        ours = self._seen.get(user_id)
+        if ours is None or (stored is not None and stored > ours):
+            return stored
+        return ours
+
+    def is_online(self, user_id, stored_last_seen=None):
+        if user_id in self._sockets:
+            return True
+        seen = self.last_seen(user_id, stored_last_seen)
+        return seen is not None and timezone.now() - seen < self.timeout
+
+    def online_ids(self, user_ids):
+        """Subset of `user_ids` that is online, with at most one query."""
+        user_ids = set(user_ids)
+        online = {uid for uid in user_ids if self.is_online(uid)}
+        rest = user_ids - online
+        if rest:
+            from .models import Profile
+            online.update(Profile.objects.filter(
+                user_id__in=rest, last_seen__gte=timezone.now() - self.timeout,
+            ).values_list("user_id", flat=True))
+        return online
+
+    def flush(self):
+        """Writes pending last_seen values (and refreshes connected users) in one UPDATE."""
+        from .models import Profile
+
+        now = timezone.now()
+        with self._lock:
+            for user_id in self._sockets:
+                self._seen[user_id] = now
+            pending = {uid: self._seen[uid] for uid in self._dirty | set(self._sockets)}
+            self._dirty.clear()
+            # Forget idle users once their last activity is stored.
+            for uid, seen in list(self._seen.items()):
+                if uid not in self._sockets and now - seen > self.timeout:
+                    del self._seen[uid]
+
+        items = list(pending.items())
+        try:
+            for i in range(0, len(items), FLUSH_CHUNK):
+                chunk = items[i:i + FLUSH_CHUNK]
+                Profile.objects.filter(user_id__in=[uid for uid, _ in chunk]).update(last_seen=Case(
+                    *[When(user_id=uid, then=Value(seen)) for uid, seen in chunk],
+                    output_field=DateTimeField(),
+                ))
+        except Exception:
+            with self._lock:
+                for uid, seen in pending.items():
+                    self._seen.setdefault(uid, seen)
+                    self._dirty.add(uid)
+            raise
+        return len(items)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                print(f"Presence flush error: {e}")
+
+
+presence = Presence(settings.PRESENCE_TIMEOUT, settings.PRESENCE_FLUSH_INTERVAL)
+
+
+def status_group(user_id):
+    """Channel-layer group of sockets watching `user_id`'s online status."""
+    return f"presence_{user_id}"
@@ -0,0 +1,122 @@
+"""
+Cached sidebar payload (groups and recent chats) for base.html.
+
+The payload is plain data, built from the database at most once per user
+until something invalidates it, and kept in the default cache for
+SIDEBAR_CACHE_TIMEOUT seconds. With several workers (CHANNEL_BROKER_SOCKET)
+settings makes that cache a shared file-based one, so an invalidation in
+one worker reaches them all. Within a request it is memoized on the
+request, so the view and the sidebar_data context processor share it.
+
+Online flags are not cached as such: the payload carries each partner's
+stored last_seen and the flag is worked out from presence on every read,
+which needs no query for sockets held by this process. Group unread counts
+change with every message anyone posts, so they are cached separately, with
+the head (newest message id) each group had when they were counted; a new
+message moves its group's head and the next read recounts, in one query for
+all the user's groups. Moving a read cursor calls invalidate_unread().
+
+Invalidation is driven by signals in users.signals: new DMs, group
+membership changes, group create/update/delete and profile (avatar)
+changes. Paths that change the payload with queryset.update(), which
+sends no signal, call invalidate() themselves.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from group.models import ConversationParticipant, Group, GroupReadCursor
+from .presence import presence
+
+RECENT_CHATS = 10
+
+
+def cache_key(user_id):
+    return f"sidebar:{user_id}"
+
+
+def unread_key(user_id):
+    return f"sidebar:unread:{user_id}"
+
+
+def head_key(group_id):
+    return f"sidebar:head:{group_id}"
+
+
+def _build(user):
+    groups = [
+        {"id": g.id, "name": g.name, "slug": g.slug, "icon_url": g.get_icon_url()}
+        for g in Group.objects.filter(members=user).order_by("-created_at")
+    ]
+
+    inbox = (
+        ConversationParticipant.objects
+        .filter(user=user, last_message_at__isnull=False)
+        .select_related("other_user__profile", "conversation")
+        .order_by("-last_message_at")[:RECENT_CHATS]
+    )
+    recent = []
+    for row in inbox:
+        other = row.other_user
+        profile = getattr(other, "profile", None)
+        recent.append({
+            "id": other.id,
+            "username": other.username,
+            "avatar_url": profile.get_avatar_url() if profile else "/static/avatars/defaults/default1.png",
+            "last_seen": profile.last_seen if profile else None,
+            "last_message_preview": row.conversation.last_message_preview,
+            "unread_count": row.unread_count,
+        })
+    return {"groups": groups, "recent": recent}
+
+
+def get_payload(request):
+    """The sidebar payload for request.user, with live online flags and group unread counts."""
+    if hasattr(request, "_sidebar_payload"):
+        return request._sidebar_payload
+
+    key = cache_key(request.user.id)
+    payload = cache.get(key)
+    if payload is None:
+        payload = _build(request.user)
+        cache.set(key, payload, settings.SIDEBAR_CACHE_TIMEOUT)
+
+    unread = _unread_counts(request.user.id, payload["groups"])
+    groups = [dict(g, unread_count=unread.get(g["slug"], 0)) for g in payload["groups"]]
+    recent = [
+        dict(u, is_online=presence.is_online(u["id"], u["last_seen"]))
+        for u in payload["recent"]
+    ]
+    request._sidebar_payload = {"groups": groups, "recent": recent}
+    return request._sidebar_payload
+
+
+def _unread_counts(user_id, groups):
+    if not groups:
+        return {}
+    slugs = [g["slug"] for g in groups]
+    heads = cache.get_many([head_key(g["id"]) for g in groups])
+    cached = cache.get(unread_key(user_id))
+    if cached and cached["slugs"] == slugs and cached["heads"] == heads:
+        return cached["counts"]
+    counts = GroupReadCursor.unread_counts(user_id, slugs)
+    cache.set(unread_key(user_id), {"slugs": slugs, "heads": heads, "counts": counts},
+              settings.SIDEBAR_CACHE_TIMEOUT)
+    return counts
+
+
+def group_message_posted(message):
+    """Moves the group's head, so every member's cached unread count is recounted."""
+    cache.set(head_key(message.group_id), message.id, None)
+
+
+def invalidate_unread(user_id):
+    """Drops a user's cached group unread counts, after their read cursor moved."""
+    cache.delete(unread_key(user_id))
+
+
+def invalidate(*user_ids):
+    """Drops the cached sidebars of `user_ids` once the current transaction commits."""
+    keys = [cache_key(uid) for uid in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,8 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_save, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import Profile
-from group.models import Group
+from group.models import ConversationParticipant, DirectMessage, Group, GroupMessage
+from . import sidebar
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -19,4 +20,45 @@ def create_profile(sender, instance, created, **kwargs):
             )
             community_group.members.add(instance)
     except Exception as e:
-            print(f"Auto-join error: {e}")
\ No newline at end of file
+            print(f"Auto-join error: {e}")
+
+# Sidebar cache invalidation (see users.sidebar).
+
+@receiver(post_save, sender=DirectMessage)
+def sidebar_new_dm(sender, instance, created, **kwargs):
+    if created:
+        sidebar.invalidate(instance.sender_id, instance.receiver_id)
+
+
+@receiver(post_save, sender=GroupMessage)
+def sidebar_group_message(sender, instance, created, **kwargs):
+    if created:
+        sidebar.group_message_posted(instance)
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def sidebar_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        # user.groups_joined.add(...): the instance is the user.
+        sidebar.invalidate(instance.pk)
+    elif action == "pre_clear":
+        sidebar.invalidate(*instance.members.values_list("id", flat=True))
+    else:
+        sidebar.invalidate(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def sidebar_group_changed(sender, instance, **kwargs):
+    if instance.pk:
+        sidebar.invalidate(*instance.members.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Profile)
+def sidebar_profile_changed(sender, instance, created, **kwargs):
+    # Avatars show up in the sidebars of everyone this user has a DM with.
+    if not created:
+        sidebar.invalidate(*ConversationParticipant.objects.filter(
+            other_user_id=instance.user_id).values_list("user_id", flat=True))
@@ -5,12 +5,13 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.db.models import Q 
 from .models import Profile
+from . import sidebar
 from .forms import ProfileUpdateForm
 from chatbot.models import AnalysisReport
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 
-from group.models import Group, DirectMessage
+from group.models import Group
 import os
 
 
@@ -25,43 +26,15 @@ def home(request):
 
 def sidebar_context(request):
     """
-    Fetches Groups and Recent Chats for the Sidebar.
+    Fetches Groups and Recent Chats for the Sidebar (cached, see users.sidebar).
     """
     if not request.user.is_authenticated:
         return {}
 
-    groups_sidebar = Group.objects.filter(members=request.user).order_by("-created_at")
-
-    direct_msgs = DirectMessage.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).order_by("-timestamp").select_related('sender', 'receiver')
-
-    user_ids = []
-    for dm in direct_msgs:
-        if dm.sender_id != request.user.id:
-            user_ids.append(dm.sender_id)
-        if dm.receiver_id != request.user.id:
-            user_ids.append(dm.receiver_id)
-
-    seen = set()
-    recent_users = []
-    for uid in user_ids:
-        if uid not in seen and uid != request.user.id:
-            seen.add(uid)
-            try:
-                user = User.objects.get(id=uid)
-                if not hasattr(user, 'profile'):
-                    Profile.objects.create(user=user)
-                recent_users.append(user)
-            except User.DoesNotExist:
-                continue
-            
-            if len(recent_users) >= 10:
-                break
-    
+    payload = sidebar.get_payload(request)
     return {
-        "groups_sidebar": groups_sidebar, 
-        "recent_users": recent_users
+        "groups_sidebar": payload["groups"], 
+        "recent_users": payload["recent"]
     }
 
 